@@ -11,21 +11,38 @@ Description:
 """
 
 import os
-import csv
 
+import numpy as np
 import pandas as pd
 
-from typing import Dict, List
+from typing import List, Tuple
+
+from src.cache import ArtifactCache
 
 DATA_DIR: str = "data"
 DATA_FILE: str = "data.csv"
 
 EDGES_DATA: str = "edges.csv"
 FEATS_DATA: str = "features.csv"
+NODES_DATA: str = "nodes.csv"
 
 
-def main() -> None:
-    """The main function. Data extraction is done here."""
+def encode_nodes(*columns: pd.Series) -> Tuple[List[np.ndarray], pd.Index]:
+    """Encode node labels in the order they are first seen, scanning the
+    columns one after the other. Returns the codes of every column and the
+    labels indexed by their code."""
+
+    codes, labels = pd.factorize(pd.concat(columns, ignore_index=True))
+
+    offsets = np.cumsum([0] + [len(column) for column in columns])
+    return (
+        [codes[lo:hi] for lo, hi in zip(offsets[:-1], offsets[1:])],
+        labels,
+    )
+
+
+def build() -> None:
+    """Build the edges, features and nodes files from data.csv."""
 
     # Read the data
     data = pd.read_csv(os.path.join(DATA_DIR, DATA_FILE))
@@ -33,34 +50,65 @@ def main() -> None:
     parents = data["node_2"]
 
     # Create node encoding
-    temp = list(nodes)
-    temp.extend(parents)
-
-    # NOTE: `all_nodes` defines the order in which the features data is built
-    all_nodes: List[str] = []
-    for item in temp:
-        if item not in all_nodes:
-            all_nodes.append(item)
-
-    node_encoding: Dict[str, int] = {
-        node: idx for idx, node in enumerate(all_nodes)
-    }
+    # NOTE: The first-seen order of the labels (all nodes, then all parents)
+    #       defines the order in which the features data is built
+    (node_codes, parent_codes), all_nodes = encode_nodes(nodes, parents)
 
     # Create edges file
-    with open(os.path.join(DATA_DIR, EDGES_DATA), "w") as csv_file:
-        writer = csv.writer(csv_file, delimiter=",")
-        # writer.writerow(["source_idx", "target_idx"])  # Header
-        for node, parent in zip(nodes, parents):
-            writer.writerow([node_encoding[node], node_encoding[parent]])
-            # NOTE: Uncomment the line below to generate duplicate edges
-            # writer.writerow([node_encoding[parent], node_encoding[node]])
+    # NOTE: Add the reversed edges (parent_codes, node_codes) as well to
+    #       generate duplicate edges
+    edges = pd.DataFrame(
+        {"source_idx": node_codes, "target_idx": parent_codes}
+    )
+
+    # The row counts of a data.csv written by ingest_sparql.py are the edge
+    # weights
+    if "count" in data.columns:
+        edges["count"] = data["count"].fillna(1).to_numpy(dtype=np.int64)
+
+    edges.to_csv(
+        os.path.join(DATA_DIR, EDGES_DATA),
+        header=False,
+        index=False,
+        line_terminator="\r\n",
+    )
 
     # Creates features file
-    with open(os.path.join(DATA_DIR, FEATS_DATA), "w") as csv_file:
-        writer = csv.writer(csv_file, delimiter=",")
-        writer.writerow(["idx", "source_idx", "feature"])  # Header
-        for idx, node in enumerate(all_nodes):
-            writer.writerow([idx, node_encoding[node], 0])
+    idx = np.arange(len(all_nodes))
+    features = pd.DataFrame({"idx": idx, "source_idx": idx, "feature": 0})
+    features.to_csv(
+        os.path.join(DATA_DIR, FEATS_DATA),
+        index=False,
+        line_terminator="\r\n",
+    )
+
+    # Create nodes file (the label of every node index, in index order)
+    # NOTE: update_graph.py extends this encoding with new labels
+    nodes = pd.DataFrame({"node": all_nodes})
+    nodes.to_csv(
+        os.path.join(DATA_DIR, NODES_DATA),
+        index=False,
+        line_terminator="\r\n",
+    )
+
+
+def main() -> None:
+    """The main function. Data extraction is done here."""
+
+    # Skip the stage if the files were already built from the same data
+    cache = ArtifactCache()
+    outputs = [
+        os.path.join(DATA_DIR, EDGES_DATA),
+        os.path.join(DATA_DIR, FEATS_DATA),
+        os.path.join(DATA_DIR, NODES_DATA),
+    ]
+    key = cache.key(
+        "edges_features",
+        [os.path.join(DATA_DIR, DATA_FILE)],
+        code=[__file__],
+        outputs=[os.path.basename(output) for output in outputs],
+    )
+    cache.restore(key, outputs, build)
 
 
 if __name__ == "__main__":
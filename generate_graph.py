@@ -13,9 +13,16 @@ Description:
 import os
 import pickle
 
-import networkx as nx
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+
+from typing import Tuple
+
+from scipy.sparse.csgraph import connected_components
+
+from src.cache import ArtifactCache
+from src.graph_io import graph_files, save_graph
 
 
 EDGES_FILE: str = "data/edges.csv"
@@ -24,49 +31,127 @@ FEATS_FILE: str = "data/features.csv"
 PICKLE_DIR: str = "pickle"
 PICKLE_FILE: str = "adj_feat.pkl"
 
+GRAPH_DIR: str = "graph"
+
+
+def read_edges(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Read the (source, target[, weight]) columns of an edge list. Edges
+    without a weight get weight 1."""
+
+    df = pd.read_csv(path, header=None)
+    sources = df[0].to_numpy(dtype=np.int64)
+    targets = df[1].to_numpy(dtype=np.int64)
+    if df.shape[1] > 2:
+        weights = df[2].fillna(1).to_numpy(dtype=np.float64)
+    else:
+        weights = np.ones(len(df), dtype=np.int64)
+
+    return sources, targets, weights
+
+
+def adjacency(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    weights: np.ndarray,
+    num_nodes: int,
+    root: int,
+    others: np.ndarray,
+) -> sp.csr_matrix:
+    """Symmetric adjacency matrix of the edges (rows, cols) plus edges of
+    weight 1 from root to the nodes others (unless already present)."""
+
+    # Undirected edges as (lower, upper) keys, an edge listed more than once
+    # (e.g. in both directions) keeps its largest weight
+    lower, upper = np.minimum(rows, cols), np.maximum(rows, cols)
+    keys = lower * num_nodes + upper
+    order = np.lexsort((weights, keys))
+    keys, weights = keys[order], weights[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    keys, weights = keys[last], weights[last]
+
+    # Root edges as one block
+    root_keys = np.minimum(root, others) * num_nodes + np.maximum(root, others)
+    root_keys = root_keys[~np.isin(root_keys, keys)]
+    keys = np.concatenate([keys, root_keys])
+    weights = np.concatenate(
+        [weights, np.ones(len(root_keys), dtype=weights.dtype)]
+    )
+
+    # Self-loops are stored once
+    lower, upper = np.divmod(keys, num_nodes)
+    mirror = lower != upper
+
+    return sp.csr_matrix(
+        (
+            np.concatenate([weights, weights[mirror]]),
+            (
+                np.concatenate([lower, upper[mirror]]),
+                np.concatenate([upper, lower[mirror]]),
+            ),
+        ),
+        shape=(num_nodes, num_nodes),
+    )
+
+
+def save(
+    adj: sp.csr_matrix, features: np.ndarray, node_ids: np.ndarray
+) -> None:
+    """Save the graph as the (adj, features) pickle and as .npy files."""
 
-def main() -> None:
-    """The main function."""
+    # Save adj, features in pickle file
+    network_tuple = (adj, features)
 
-    # Read edge list
-    g = nx.read_edgelist(EDGES_FILE, delimiter=",", nodetype=int)
+    with open(os.path.join(PICKLE_DIR, PICKLE_FILE), "wb") as f:
+        pickle.dump(network_tuple, f)
+
+    # Save adj, features and node ids in the memory-mappable format
+    save_graph(GRAPH_DIR, adj, features, node_ids)
 
-    # Add root
-    # NOTE: The root is directly connected to all other nodes
-    g.add_node(int(0))
 
-    for node in g.nodes():
-        if node != int(0):
-            g.add_edge(int(0), node)
+def build() -> None:
+    """Build the (adj, features) pickle from the edges and features files."""
 
-    # Read feature list
+    # Read edge list and feature list
+    sources, targets, weights = read_edges(EDGES_FILE)
     df = pd.read_csv(FEATS_FILE, index_col=0)
 
-    # Add features from dataframe to networkx nodes
-    for node_idx, features_series in df.iterrows():
-        if not g.has_node(node_idx):
-            g.add_node(node_idx)
-            g.add_edge(node_idx, int(0))
+    # Row i of adj and features is node node_ids[i] (sorted node ids)
+    node_ids = np.unique(
+        np.concatenate([[0], sources, targets, df.index.to_numpy()])
+    )
+    rows = np.searchsorted(node_ids, sources)
+    cols = np.searchsorted(node_ids, targets)
 
-        g.nodes[node_idx]["features"] = features_series.values
+    # Add root
+    # NOTE: The root is directly connected to all other nodes
+    root = np.searchsorted(node_ids, 0)
+    others = np.delete(np.arange(len(node_ids)), root)
+    adj = adjacency(rows, cols, weights, len(node_ids), root, others)
 
     # Make sure the graph is connected
-    assert nx.is_connected(g) is True
+    assert connected_components(adj, directed=False)[0] == 1
 
-    # Get adjacency matrix in sparse format (sorted by g.nodes())
-    adj = nx.adjacency_matrix(g)
+    # Get features matrix (sorted by node id, missing nodes get zeros)
+    features = df.reindex(node_ids, fill_value=0).to_numpy(dtype=np.float64)
 
-    # Get features matrix (also sorted by g.nodes())
-    features = np.zeros((df.shape[0], df.shape[1]))  # num nodes, num features
+    save(adj, features, node_ids)
 
-    for idx, node in enumerate(g.nodes()):
-        features[idx, :] = g.nodes[node]["features"]
 
-    # Save adj, features in pickle file
-    network_tuple = (adj, features)
+def main() -> None:
+    """The main function."""
 
-    with open(os.path.join(PICKLE_DIR, PICKLE_FILE), "wb") as f:
-        pickle.dump(network_tuple, f)
+    # Skip the stage if the pickle was already built from the same files
+    cache = ArtifactCache()
+    outputs = [os.path.join(PICKLE_DIR, PICKLE_FILE)]
+    outputs.extend(graph_files(GRAPH_DIR))
+    key = cache.key(
+        "adj_feat",
+        [EDGES_FILE, FEATS_FILE],
+        code=[__file__],
+        outputs=[os.path.basename(output) for output in outputs],
+    )
+    os.makedirs(GRAPH_DIR, exist_ok=True)
+    cache.restore(key, outputs, build)
 
 
 if __name__ == "__main__":
@@ -17,12 +17,14 @@ import pandas as pd
 
 from typing import Dict
 
+from src.cache import ArtifactCache
+
 DATA_DIR: str = "data"
 DATA_FILE: str = "CIDO.csv"
 
 
-def main() -> None:
-    """The main function. Data extraction is done here."""
+def build() -> None:
+    """Build data.csv from the CIDO classes."""
 
     # Read the data
     data = pd.read_csv(os.path.join(DATA_DIR, DATA_FILE))
@@ -62,5 +64,16 @@ def main() -> None:
             writer.writerow([node, graph[node]["parent"], graph[node]["text"]])
 
 
+def main() -> None:
+    """The main function. Data extraction is done here."""
+
+    # Skip the stage if data.csv was already built from the same input
+    cache = ArtifactCache()
+    key = cache.key(
+        "graph_data", [os.path.join(DATA_DIR, DATA_FILE)], code=[__file__]
+    )
+    cache.restore(key, [os.path.join(DATA_DIR, "data.csv")], build)
+
+
 if __name__ == "__main__":
     main()
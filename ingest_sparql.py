@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: ingest_sparql.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Build the data, edges, features and nodes files from the results of the
+    co-occurrence query (sparql_query/README).
+
+    The results are read as a stream, from a SPARQL JSON, CSV or TSV
+    results file or from a SPARQL endpoint the query is sent to. Every row
+    becomes an edge between the labels text0@type0 and text1@type1 with
+    the row count as its weight. Labels are encoded in the order they are
+    first seen and an edge seen again (in either direction) is skipped, so
+    it keeps its first, largest count. The files are written in chunks of
+    CHUNK_SIZE rows: only the label codes and the seen edges are kept in
+    memory. The files are written next to the old ones and replace them only
+    once all results were read, so a source that cannot be opened or fails
+    halfway leaves the old files as they were.
+
+    The types are the type0 and type1 variables of the results if the
+    query selects them and the given types (by default those the query
+    filters on) otherwise.
+
+Usage:
+    python ingest_sparql.py results.{json,csv,tsv} [type0 type1]
+    python ingest_sparql.py http://localhost:3030/cord19/sparql [type0 type1]
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import sys
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from urllib.parse import urlencode
+
+from generate_edges_features_data import (
+    DATA_DIR,
+    DATA_FILE,
+    EDGES_DATA,
+    FEATS_DATA,
+    NODES_DATA,
+)
+
+QUERY_FILE: str = "sparql_query/README"
+
+TEXT_VARS: Tuple[str, str] = ("text0", "text1")
+TYPE_VARS: Tuple[str, str] = ("type0", "type1")
+COUNT_VAR: str = "count"
+DEFAULT_TYPES: Tuple[str, str] = ("Disease", "Mutation")
+
+CHUNK_SIZE: int = 100000
+BLOCK_SIZE: int = 2 ** 16
+
+# Escapes of quoted literals in SPARQL TSV results
+ESCAPES: Dict[str, str] = {
+    "t": "\t",
+    "n": "\n",
+    "r": "\r",
+    "b": "\b",
+    "f": "\f",
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+}
+ESCAPE = re.compile(r"\\(.)")
+
+Binding = Dict[str, str]
+
+
+def iter_json(stream: io.TextIOBase) -> Iterator[Binding]:
+    """Bindings of SPARQL JSON results, decoded one at a time from blocks
+    of the stream."""
+
+    decoder = json.JSONDecoder()
+    separators = re.compile(r"[\s,]*")
+
+    # Skip to the start of the bindings array
+    buffer = ""
+    while True:
+        start = buffer.find('"bindings"')
+        if start >= 0 and buffer.find("[", start) >= 0:
+            pos = buffer.find("[", start) + 1
+            break
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            return
+        buffer += block
+
+    while True:
+        pos = separators.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+        try:
+            binding, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Incomplete binding, read on
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                raise
+            buffer, pos = buffer[pos:] + block, 0
+            continue
+
+        yield {var: term["value"] for var, term in binding.items()}
+
+
+def iter_csv(stream: io.TextIOBase) -> Iterator[Binding]:
+    """Bindings of SPARQL CSV results."""
+
+    yield from csv.DictReader(stream)
+
+
+def tsv_value(term: str) -> str:
+    """Value of an RDF term of SPARQL TSV results, e.g. pneumonia for
+    "pneumonia"@en and 3 for "3"^^<http://www.w3.org/2001/XMLSchema#int>."""
+
+    if term.startswith('"'):
+        literal = term[1 : term.rindex('"')]
+        return ESCAPE.sub(
+            lambda match: ESCAPES.get(match.group(1), match.group(0)), literal
+        )
+    if term.startswith("<") and term.endswith(">"):
+        return term[1:-1]
+
+    return term
+
+
+def iter_tsv(stream: io.TextIOBase) -> Iterator[Binding]:
+    """Bindings of SPARQL TSV results."""
+
+    variables = [var.lstrip("?$") for var in stream.readline().split("\t")]
+    variables[-1] = variables[-1].rstrip("\r\n")
+    for line in stream:
+        terms = line.rstrip("\r\n").split("\t")
+        yield {
+            var: tsv_value(term) for var, term in zip(variables, terms) if term
+        }
+
+
+READERS = {"json": iter_json, "csv": iter_csv, "tsv": iter_tsv}
+
+
+def open_source(source: str) -> Tuple[BinaryIO, str]:
+    """Open a results file, or send the query to an endpoint. Returns the
+    binary stream of the results and their format."""
+
+    if not source.startswith(("http://", "https://")):
+        extension = os.path.splitext(source)[1].lstrip(".").lower()
+        if extension not in READERS:
+            raise ValueError(
+                "unknown results format {!r}, expected one of {}".format(
+                    extension, ", ".join(READERS)
+                )
+            )
+        return open(source, "rb"), extension
+
+    with open(QUERY_FILE) as file:
+        query = file.read()
+    request = urllib.request.Request(
+        source,
+        data=urlencode({"query": query}).encode(),
+        headers={
+            "Accept": "application/sparql-results+json",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+    )
+    response = urllib.request.urlopen(request)
+
+    content_type = response.headers.get("Content-Type", "")
+    if "tab-separated" in content_type:
+        return response, "tsv"
+    if "csv" in content_type:
+        return response, "csv"
+
+    return response, "json"
+
+
+def read_bindings(stream: BinaryIO, results_format: str) -> Iterator[Binding]:
+    """Bindings of the results in a binary stream, read as a stream."""
+
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    yield from READERS[results_format](text)
+
+
+def iter_bindings(source: str) -> Iterator[Binding]:
+    """Bindings of the results of source, read as a stream."""
+
+    stream, results_format = open_source(source)
+    with stream:
+        yield from read_bindings(stream, results_format)
+
+
+def append(df: pd.DataFrame, path: str, header: bool = False) -> None:
+    """Append df to a file."""
+
+    df.to_csv(
+        path,
+        mode="a",
+        header=header,
+        index=False,
+        line_terminator="\r\n",
+    )
+
+
+def ingest(
+    source: str, types: Tuple[str, str] = DEFAULT_TYPES
+) -> Tuple[int, int, int]:
+    """Write the data, edges, features and nodes files of the results of
+    source. Returns the number of rows, nodes and edges."""
+
+    # Open the source before any file is touched
+    stream, results_format = open_source(source)
+
+    # The new files are written next to the old ones
+    paths = {
+        filename: os.path.join(DATA_DIR, filename)
+        for filename in (DATA_FILE, EDGES_DATA, FEATS_DATA, NODES_DATA)
+    }
+    tmp_paths = {filename: path + ".tmp" for filename, path in paths.items()}
+
+    try:
+        with stream:
+            counts = write_files(
+                read_bindings(stream, results_format), types, tmp_paths
+            )
+    except BaseException:
+        for tmp_path in tmp_paths.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    for filename, path in paths.items():
+        os.replace(tmp_paths[filename], path)
+
+    return counts
+
+
+def write_files(
+    bindings: Iterator[Binding],
+    types: Tuple[str, str],
+    paths: Dict[str, str],
+) -> Tuple[int, int, int]:
+    """Write the data, edges, features and nodes files (paths by filename)
+    of bindings. Returns the number of rows, nodes and edges."""
+
+    # Start the files over, with their headers
+    for path in paths.values():
+        if os.path.exists(path):
+            os.remove(path)
+    append(
+        pd.DataFrame(columns=["node_1", "node_2", "count"]),
+        paths[DATA_FILE],
+        True,
+    )
+    append(pd.DataFrame(columns=["node"]), paths[NODES_DATA], True)
+
+    codes: Dict[str, int] = {}
+    seen = set()
+
+    rows: List[Tuple[str, str, int]] = []
+    new_labels: List[str] = []
+
+    def flush() -> None:
+        data = pd.DataFrame(rows, columns=["node_1", "node_2", "count"])
+        edges = pd.DataFrame(
+            {
+                "source_idx": data["node_1"].map(codes),
+                "target_idx": data["node_2"].map(codes),
+                "count": data["count"],
+            }
+        )
+        append(data, paths[DATA_FILE])
+        append(edges, paths[EDGES_DATA])
+        append(pd.DataFrame({"node": new_labels}), paths[NODES_DATA])
+        rows.clear()
+        new_labels.clear()
+
+    num_rows = 0
+    for binding in bindings:
+        num_rows += 1
+        texts = [binding.get(var, "") for var in TEXT_VARS]
+        if not all(texts):
+            continue
+
+        labels = [
+            text + "@" + binding.get(type_var, default)
+            for text, type_var, default in zip(texts, TYPE_VARS, types)
+        ]
+        for label in labels:
+            if label not in codes:
+                codes[label] = len(codes)
+                new_labels.append(label)
+
+        # Undirected edge key
+        source_code, target_code = codes[labels[0]], codes[labels[1]]
+        key = min(source_code, target_code) << 32 | max(
+            source_code, target_code
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+
+        rows.append((labels[0], labels[1], int(binding.get(COUNT_VAR) or 1)))
+        if len(rows) >= CHUNK_SIZE:
+            flush()
+    flush()
+
+    # Features file
+    # NOTE: One feature per node, as in generate_edges_features_data.py
+    append(
+        pd.DataFrame(columns=["idx", "source_idx", "feature"]),
+        paths[FEATS_DATA],
+        True,
+    )
+    for lo in range(0, len(codes), CHUNK_SIZE):
+        idx = np.arange(lo, min(lo + CHUNK_SIZE, len(codes)))
+        append(
+            pd.DataFrame({"idx": idx, "source_idx": idx, "feature": 0}),
+            paths[FEATS_DATA],
+        )
+
+    return num_rows, len(codes), len(seen)
+
+
+def main() -> None:
+    """The main function. The ingestion is done here."""
+
+    if len(sys.argv) not in (2, 4):
+        sys.exit(
+            "Usage: python ingest_sparql.py results_file|endpoint_url "
+            "[type0 type1]"
+        )
+
+    types = (sys.argv[2], sys.argv[3]) if len(sys.argv) == 4 else DEFAULT_TYPES
+    num_rows, num_nodes, num_edges = ingest(sys.argv[1], types)
+
+    print("Rows:", num_rows)
+    print("Nodes:", num_nodes)
+    print("Edges:", num_edges)
+
+
+if __name__ == "__main__":
+    main()
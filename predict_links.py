@@ -10,22 +10,26 @@ Description:
     Use node2vec for link prediction.
 """
 
+import inspect
 import os
-import pickle
 
 import node2vec
 
 import matplotlib.pyplot as plt
-import networkx as nx
 import numpy as np
 import pandas as pd
 import scipy.sparse as sp
 
+from typing import Dict, Iterable, List, Tuple, Union
+
 from sklearn.linear_model import LogisticRegression
 
 from sklearn.metrics import average_precision_score
 from sklearn.metrics import roc_auc_score
 
+from src.cache import ArtifactCache
+from src.embeddings import OPERATORS, EdgeEmbedder, node_embedding_matrix
+from src.graph_io import convert_pickle, graph_files, load_graph
 from src.preprocessing import mask_test_edges
 from src import node2vec
 
@@ -34,26 +38,174 @@ from gensim.models import Word2Vec
 
 NETWORK_DIR = "pickle"
 PICKLE_FILE = "adj_feat.pkl"
+GRAPH_DIR = "graph"
+
+# Source files of the cached stages, a change to any of them invalidates the
+# cached artifacts
+CODE_FILES = [
+    __file__,
+    inspect.getfile(mask_test_edges),
+    inspect.getfile(node_embedding_matrix),
+    node2vec.__file__,
+]
+
+# Split type: adj_train, train_edges, train_edges_false, val_edges,
+# val_edges_false, test_edges, test_edges_false
+Split = Tuple[
+    sp.csr_matrix,
+    np.ndarray,
+    np.ndarray,
+    np.ndarray,
+    np.ndarray,
+    np.ndarray,
+    np.ndarray,
+]
+
+
+def load_network() -> Tuple[sp.csr_matrix, np.ndarray]:
+    """Load (adj, feat) memory-mapped from the binary graph format, node
+    indices are 0 to N-1. An old pickle is converted on first use."""
+
+    if not os.path.exists(graph_files(GRAPH_DIR)[0]):
+        convert_pickle(os.path.join(NETWORK_DIR, PICKLE_FILE), GRAPH_DIR)
+
+    adj, features, _ = load_graph(GRAPH_DIR)
+
+    return adj, features
+
+
+def split_edges(
+    adj: sp.csr_matrix,
+    seed: int = 0,
+    test_frac: float = 0.3,
+    val_frac: float = 0.1,
+) -> Split:
+    """Perform the train-test split, the split only depends on its inputs."""
+
+    np.random.seed(seed)  # make sure train-test split is consistent
+
+    return mask_test_edges(
+        adj, test_frac=test_frac, val_frac=val_frac, spanning_tree=True
+    )
+
+
+def train_embeddings(
+    walks: Union[Iterable[List[str]], str],
+    num_nodes: int,
+    dimensions: int,
+    window_size: int,
+    workers: int,
+    iterations: int,
+) -> np.ndarray:
+    """Train a skip-gram model on walks (or on the LineSentence file at that
+    path), return the node embeddings matrix (rows = nodes, columns =
+    embedding features)."""
+
+    if isinstance(walks, str):
+        corpus = {"corpus_file": walks}
+    else:
+        corpus = {"sentences": walks}
+
+    model = Word2Vec(
+        **corpus,
+        size=dimensions,
+        window=window_size,
+        min_count=0,
+        sg=1,
+        workers=workers,
+        iter=iterations,
+    )
+
+    return node_embedding_matrix(model.wv, num_nodes)
+
+
+def evaluate(
+    emb_matrix: np.ndarray, split: Split
+) -> Dict[str, Dict[str, float]]:
+    """Score the edge classifier of every edge embedding operator on the
+    validation and test sets (ROC AUC and average precision)."""
+
+    (
+        _,
+        train_edges,
+        train_edges_false,
+        val_edges,
+        val_edges_false,
+        test_edges,
+        test_edges_false,
+    ) = split
+
+    # Edge embeddings (as is done in node2vec paper): positive edges first,
+    # then negative edges. One buffer per set is reused by every operator.
+    edge_embedder = EdgeEmbedder(
+        emb_matrix,
+        {
+            "train": np.concatenate([train_edges, train_edges_false]),
+            "val": np.concatenate([val_edges, val_edges_false]),
+            "test": np.concatenate([test_edges, test_edges_false]),
+        },
+    )
+
+    # Create edge labels: 1 = real edge, 0 = false edge
+    train_edge_labels = np.concatenate(
+        [np.ones(len(train_edges)), np.zeros(len(train_edges_false))]
+    )
+    val_edge_labels = np.concatenate(
+        [np.ones(len(val_edges)), np.zeros(len(val_edges_false))]
+    )
+    test_edge_labels = np.concatenate(
+        [np.ones(len(test_edges)), np.zeros(len(test_edges_false))]
+    )
+
+    scores: Dict[str, Dict[str, float]] = {}
+    for operator in OPERATORS:
+        edge_embs = edge_embedder.embed(operator)
+
+        # Train logistic regression classifier on train-set edge embeddings
+        edge_classifier = LogisticRegression(random_state=0)
+        edge_classifier.fit(edge_embs["train"], train_edge_labels)
+
+        # Predicted edge scores: probability of being of class "1" (real edge)
+        val_preds = edge_classifier.predict_proba(edge_embs["val"])[:, 1]
+        test_preds = edge_classifier.predict_proba(edge_embs["test"])[:, 1]
+
+        scores[operator] = {
+            "val_roc": roc_auc_score(val_edge_labels, val_preds),
+            "val_ap": average_precision_score(val_edge_labels, val_preds),
+            "test_roc": roc_auc_score(test_edge_labels, test_preds),
+            "test_ap": average_precision_score(test_edge_labels, test_preds),
+        }
+
+    return scores
 
 
 def main() -> None:
     """The main function. Link prediction is done here."""
 
-    # Load pickled (adj, feat) tuple
-    with open(os.path.join(NETWORK_DIR, PICKLE_FILE), "rb") as file:
-        adj, features = pickle.load(file)
-
-    g = nx.Graph(adj)  # Recreate graph using node indices (0 to num_nodes-1)
+    adj_sparse, features = load_network()
 
     # Draw the network
+    # g = nx.Graph(adj_sparse)
     # nx.draw_networkx(g, with_labels=False, node_size=50, node_color="r")
     # plt.show()
 
-    # Preprocessing (train/test split)
-    np.random.seed(0)  # make sure train-test split is consistent
-    adj_sparse = nx.to_scipy_sparse_matrix(g)
+    # NOTE: Every stage below is cached on disk by its inputs
+    cache = ArtifactCache()
 
     # Perform train-test split
+    # NOTE: The graph stays in sparse format
+    split_key = cache.key(
+        "split",
+        graph_files(GRAPH_DIR),
+        CODE_FILES,
+        seed=0,
+        test_frac=0.3,
+        val_frac=0.1,
+    )
+    split = cache.fetch(
+        split_key,
+        lambda: split_edges(adj_sparse, seed=0, test_frac=0.3, val_frac=0.1),
+    )
     (
         adj_train,
         train_edges,
@@ -62,10 +214,7 @@ def main() -> None:
         val_edges_false,
         test_edges,
         test_edges_false,
-    ) = mask_test_edges(adj_sparse, test_frac=0.3, val_frac=0.1)
-
-    # new graph object with only non-hidden edges
-    g_train = nx.from_scipy_sparse_matrix(adj_train)
+    ) = split
 
     # Inspect train/test split
     print("Total nodes:", adj_sparse.shape[0])
@@ -83,6 +232,7 @@ def main() -> None:
 
     # node2vec settings
     # NOTE: When p = q = 1, this is equivalent to DeepWalk
+    # NOTE: See sweep.py for trying several settings in one run
 
     P = 1  # Return hyperparameter
     Q = 1  # In-out hyperparameter
@@ -93,104 +243,74 @@ def main() -> None:
     DIRECTED = False  # Graph directed/undirected
     WORKERS = 8  # Num. parallel workers
     ITER = 1  # SGD epochs
+    MAX_TABLE_DEGREE = 50  # Larger nodes are sampled by rejection (p != q)
 
     # Preprocessing, generate walks
 
-    # create node2vec graph instance
-    g_n2v = node2vec.Graph(g_train, DIRECTED, P, Q)
-    g_n2v.preprocess_transition_probs()
-    walks = g_n2v.simulate_walks(NUM_WALKS, WALK_LENGTH)
-    walks = [list(map(str, walk)) for walk in walks]
-
-    # Train skip-gram model
-    model = Word2Vec(
-        walks,
-        size=DIMENSIONS,
-        window=WINDOW_SIZE,
-        min_count=0,
-        sg=1,
-        workers=WORKERS,
-        iter=ITER,
+    # create node2vec graph instance with only non-hidden edges
+    def preprocess() -> node2vec.Graph:
+        g_n2v = node2vec.Graph.from_sparse(adj_train, DIRECTED, P, Q)
+        g_n2v.preprocess_transition_probs(
+            flat=True, max_table_degree=MAX_TABLE_DEGREE, verbose=True
+        )
+        return g_n2v
+
+    alias_key = cache.key(
+        "alias",
+        code=CODE_FILES,
+        split=split_key,
+        p=P,
+        q=Q,
+        directed=DIRECTED,
+        max_table_degree=MAX_TABLE_DEGREE,
     )
-
-    # Store embeddings mapping
-    emb_mappings = model.wv
-
-    print(emb_mappings)
-
-    # Create node embeddings matrix (rows = nodes, columns = embedding features)
-    emb_list = []
-    for node_index in range(0, adj_sparse.shape[0]):
-        node_str = str(node_index)
-        node_emb = emb_mappings[node_str]
-        emb_list.append(node_emb)
-    emb_matrix = np.vstack(emb_list)
-
-    def get_edge_embeddings(edge_list):
-        """
-        Generate bootstrapped edge embeddings (as is done in node2vec paper)
-        Edge embedding for (v1, v2) = hadamard product of node embeddings for
-        v1, v2.
-        """
-        embs = []
-        for edge in edge_list:
-            node1 = edge[0]
-            node2 = edge[1]
-            emb1 = emb_matrix[node1]
-            emb2 = emb_matrix[node2]
-            edge_emb = np.multiply(emb1, emb2)
-            embs.append(edge_emb)
-        embs = np.array(embs)
-        return embs
-
-    # Train-set edge embeddings
-    pos_train_edge_embs = get_edge_embeddings(train_edges)
-    neg_train_edge_embs = get_edge_embeddings(train_edges_false)
-    train_edge_embs = np.concatenate(
-        [pos_train_edge_embs, neg_train_edge_embs]
+    g_n2v = cache.fetch(alias_key, preprocess)
+
+    # Walks are streamed to Word2Vec from a LineSentence file
+    walks_key = cache.key(
+        "walks",
+        code=CODE_FILES,
+        alias=alias_key,
+        num_walks=NUM_WALKS,
+        walk_length=WALK_LENGTH,
+        seed=0,
     )
-
-    # Create train-set edge labels: 1 = real edge, 0 = false edge
-    train_edge_labels = np.concatenate(
-        [np.ones(len(train_edges)), np.zeros(len(train_edges_false))]
+    walks_file = cache.fetch_path(
+        walks_key,
+        "walks.txt",
+        lambda path: g_n2v.write_walks(
+            path, NUM_WALKS, WALK_LENGTH, workers=WORKERS, seed=0
+        ),
     )
 
-    # Val-set edge embeddings, labels
-    pos_val_edge_embs = get_edge_embeddings(val_edges)
-    neg_val_edge_embs = get_edge_embeddings(val_edges_false)
-    val_edge_embs = np.concatenate([pos_val_edge_embs, neg_val_edge_embs])
-    val_edge_labels = np.concatenate(
-        [np.ones(len(val_edges)), np.zeros(len(val_edges_false))]
+    # Train skip-gram model
+    emb_key = cache.key(
+        "embeddings",
+        code=CODE_FILES,
+        walks=walks_key,
+        dimensions=DIMENSIONS,
+        window_size=WINDOW_SIZE,
+        iter=ITER,
     )
-
-    # Test-set edge embeddings, labels
-    pos_test_edge_embs = get_edge_embeddings(test_edges)
-    neg_test_edge_embs = get_edge_embeddings(test_edges_false)
-    test_edge_embs = np.concatenate([pos_test_edge_embs, neg_test_edge_embs])
-
-    # Create val-set edge labels: 1 = real edge, 0 = false edge
-    test_edge_labels = np.concatenate(
-        [np.ones(len(test_edges)), np.zeros(len(test_edges_false))]
+    emb_matrix = cache.fetch(
+        emb_key,
+        lambda: train_embeddings(
+            walks_file,
+            adj_sparse.shape[0],
+            DIMENSIONS,
+            WINDOW_SIZE,
+            WORKERS,
+            ITER,
+        ),
     )
 
-    # Train logistic regression classifier on train-set edge embeddings
-    edge_classifier = LogisticRegression(random_state=0)
-    edge_classifier.fit(train_edge_embs, train_edge_labels)
-
-    # Predicted edge scores: probability of being of class "1" (real edge)
-    val_preds = edge_classifier.predict_proba(val_edge_embs)[:, 1]
-    val_roc = roc_auc_score(val_edge_labels, val_preds)
-    val_ap = average_precision_score(val_edge_labels, val_preds)
-
-    # Predicted edge scores: probability of being of class "1" (real edge)
-    test_preds = edge_classifier.predict_proba(test_edge_embs)[:, 1]
-    test_roc = roc_auc_score(test_edge_labels, test_preds)
-    test_ap = average_precision_score(test_edge_labels, test_preds)
-
-    print("node2vec Validation ROC score: ", str(val_roc))
-    print("node2vec Validation AP score: ", str(val_ap))
-    print("node2vec Test ROC score: ", str(test_roc))
-    print("node2vec Test AP score: ", str(test_ap))
+    for operator, score in evaluate(emb_matrix, split).items():
+        print(
+            f"node2vec ({operator}) Validation ROC score: ", score["val_roc"]
+        )
+        print(f"node2vec ({operator}) Validation AP score: ", score["val_ap"])
+        print(f"node2vec ({operator}) Test ROC score: ", score["test_roc"])
+        print(f"node2vec ({operator}) Test AP score: ", score["test_ap"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""
+Content-addressed on-disk cache for pipeline artifacts.
+
+Every artifact is stored under a key that hashes the name of the stage that
+produced it, the contents of its input files, the source files of the code
+that computes it and its parameters, so a stage can be skipped whenever an
+artifact with the same key already exists. The least recently used
+artifacts are evicted once the cache grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+CACHE_DIR = ".cache"
+MAX_BYTES = 4 * 2 ** 30
+
+# Digests of input files, keyed by (path, size, mtime)
+_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents."""
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if stamp not in _digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(2 ** 20), b""):
+                digest.update(block)
+        _digests[stamp] = digest.hexdigest()
+
+    return _digests[stamp]
+
+
+class ArtifactCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, stage, inputs=(), code=(), **params):
+        """Key of the artifact of stage computed from input files by the
+           source files code with parameters. Keys of upstream artifacts can
+           be passed as params.
+        """
+
+        description = {
+            "stage": stage,
+            "inputs": [file_digest(path) for path in inputs],
+            "code": [file_digest(path) for path in code],
+            "params": params,
+        }
+        text = json.dumps(description, sort_keys=True, default=str)
+
+        return stage + "-" + hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def fetch(self, key, compute):
+        """Return the object stored under key, or compute and store it."""
+
+        path = self._lookup(key)
+        if path is not None:
+            with open(os.path.join(path, "object.pkl"), "rb") as file:
+                return pickle.load(file)
+
+        obj = compute()
+
+        def save(tmp):
+            with open(os.path.join(tmp, "object.pkl"), "wb") as file:
+                pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._store(key, save)
+
+        return obj
+
+    def fetch_path(self, key, filename, build):
+        """Path of the cached file stored under key. On a miss, build(path)
+           is called to write the file first.
+        """
+
+        path = self._lookup(key)
+        if path is None:
+            path = self._store(
+                key, lambda tmp: build(os.path.join(tmp, filename))
+            )
+
+        return os.path.join(path, filename)
+
+    def restore(self, key, outputs, build):
+        """Make sure the output files of a stage exist. On a hit they are
+           copied from the cache and build is skipped; on a miss build() is
+           run and its outputs are stored. Returns True on a hit.
+        """
+
+        path = self._lookup(key)
+        if path is not None:
+            for output in outputs:
+                shutil.copyfile(
+                    os.path.join(path, os.path.basename(output)), output
+                )
+            return True
+
+        build()
+
+        def save(tmp):
+            for output in outputs:
+                shutil.copyfile(
+                    output, os.path.join(tmp, os.path.basename(output))
+                )
+
+        self._store(key, save)
+
+        return False
+
+    def evict(self, keep=None):
+        """Remove least recently used artifacts until the cache fits into
+           max_bytes. The artifact keep is never removed.
+        """
+
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, filename))
+                for filename in os.listdir(path)
+            )
+            entries.append((os.path.getmtime(path), size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+
+    def _lookup(self, key):
+        """Path of the artifact stored under key, or None. A hit marks the
+           artifact as recently used.
+        """
+
+        path = os.path.join(self.root, key)
+        if not os.path.isdir(path):
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+
+        return path
+
+    def _store(self, key, save):
+        """Write an artifact with save(directory) and move it in place."""
+
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            save(tmp)
+            os.replace(tmp, os.path.join(self.root, key))
+        except OSError:
+            # Another process stored the same artifact first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(os.path.join(self.root, key)):
+                raise
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+
+        return os.path.join(self.root, key)
@@ -0,0 +1,135 @@
+"""
+Edge embeddings built from node embeddings with the binary operators of the
+node2vec paper: Hadamard, Average, Weighted-L1 and Weighted-L2.
+"""
+
+import numpy as np
+
+OPERATORS = ("hadamard", "average", "l1", "l2")
+
+
+def edge_embeddings(
+    emb_matrix, edge_list, operator="hadamard", out=None, chunk_size=None
+):
+    """Embed every edge (v1, v2) as operator(emb[v1], emb[v2]).
+
+    Rows are gathered straight into out (allocated when not given) and
+    combined in place, chunk_size edges at a time, so at most one chunk of
+    emb[v2] rows is held in scratch memory.
+    """
+    edge_list = np.asarray(edge_list).reshape(-1, 2)
+    num_edges = len(edge_list)
+    if out is None:
+        out = np.empty(
+            (num_edges, emb_matrix.shape[1]), dtype=emb_matrix.dtype
+        )
+    if chunk_size is None:
+        chunk_size = max(num_edges, 1)
+
+    scratch = np.empty(
+        (min(chunk_size, num_edges), emb_matrix.shape[1]),
+        dtype=emb_matrix.dtype,
+    )
+    for lo in range(0, num_edges, chunk_size):
+        hi = min(lo + chunk_size, num_edges)
+        emb1 = out[lo:hi]
+        emb2 = scratch[: hi - lo]
+        np.take(emb_matrix, edge_list[lo:hi, 0], axis=0, out=emb1)
+        np.take(emb_matrix, edge_list[lo:hi, 1], axis=0, out=emb2)
+        _combine(operator, emb1, emb2)
+
+    return out
+
+
+def _combine(operator, emb1, emb2):
+    """Apply a binary operator in place, storing the result in emb1."""
+    if operator == "hadamard":
+        np.multiply(emb1, emb2, out=emb1)
+    elif operator == "average":
+        np.add(emb1, emb2, out=emb1)
+        emb1 *= 0.5
+    elif operator == "l1":
+        np.subtract(emb1, emb2, out=emb1)
+        np.abs(emb1, out=emb1)
+    elif operator == "l2":
+        np.subtract(emb1, emb2, out=emb1)
+        np.square(emb1, out=emb1)
+    else:
+        raise ValueError(
+            "unknown operator {!r}, expected one of {}".format(
+                operator, ", ".join(OPERATORS)
+            )
+        )
+
+
+class EdgeEmbedder:
+    """Edge embeddings of fixed edge sets (e.g. train/val/test) under
+    several operators.
+
+    Each edge set gets one output buffer that is allocated once and
+    overwritten by every call to embed.
+    """
+
+    def __init__(self, emb_matrix, edge_sets, chunk_size=None):
+        self.emb_matrix = emb_matrix
+        self.chunk_size = chunk_size
+        self.edge_sets = {
+            name: np.asarray(edge_list).reshape(-1, 2)
+            for name, edge_list in edge_sets.items()
+        }
+        self.buffers = {
+            name: np.empty(
+                (len(edge_list), emb_matrix.shape[1]), dtype=emb_matrix.dtype
+            )
+            for name, edge_list in self.edge_sets.items()
+        }
+
+    def embed(self, operator):
+        """Return {name: edge embeddings} for operator (shared buffers)."""
+        for name, edge_list in self.edge_sets.items():
+            edge_embeddings(
+                self.emb_matrix,
+                edge_list,
+                operator,
+                out=self.buffers[name],
+                chunk_size=self.chunk_size,
+            )
+
+        return self.buffers
+
+
+def node_embedding_matrix(wv, num_nodes, missing="zero"):
+    """Embedding matrix of nodes 0..num_nodes-1 (tokens "0", "1", ...).
+
+    Node ids are mapped to rows of wv.vectors once through the vocabulary
+    order, so this is a zero-copy view when the vocabulary is already in
+    node order and a single gather otherwise. Nodes missing from the
+    vocabulary (e.g. nodes that appeared in no walk) get zero rows with
+    missing="zero" and raise a KeyError with missing="raise".
+    """
+    node_ids = np.asarray(wv.index2word).astype(np.int64)
+    if len(node_ids) == num_nodes and (node_ids == np.arange(num_nodes)).all():
+        return wv.vectors
+
+    in_range = (node_ids >= 0) & (node_ids < num_nodes)
+    rows = np.full(num_nodes, -1, dtype=np.int64)
+    rows[node_ids[in_range]] = np.flatnonzero(in_range)
+
+    absent = rows < 0
+    if absent.any():
+        if missing == "raise":
+            raise KeyError(
+                "{} node(s) missing from the vocabulary, e.g. {}".format(
+                    absent.sum(), np.flatnonzero(absent)[:5].tolist()
+                )
+            )
+        print(
+            "WARNING:",
+            absent.sum(),
+            "node(s) missing from the vocabulary, using zero embeddings",
+        )
+
+    emb_matrix = wv.vectors[np.maximum(rows, 0)]
+    emb_matrix[absent] = 0
+
+    return emb_matrix
@@ -0,0 +1,167 @@
+"""
+Binary graph format.
+
+A graph is a directory of .npy files: the CSR arrays of the adjacency
+matrix (indptr, indices, data, shape), the features array and the node ids
+of the adjacency rows. Unlike the pickled (adj, features) tuple the arrays
+can be opened with mmap_mode="r", so loading is close to instant and
+several processes share the same pages.
+
+Usage (convert the pickle written by generate_graph.py):
+    python -m src.graph_io [pickle/adj_feat.pkl] [graph]
+"""
+
+import csv
+import os
+import pickle
+import sys
+
+import numpy as np
+import scipy.sparse as sp
+
+GRAPH_DIR = "graph"
+PICKLE_FILE = "pickle/adj_feat.pkl"
+EDGES_FILE = "data/edges.csv"
+FEATS_FILE = "data/features.csv"
+NODES_FILE = "data/nodes.csv"
+
+ARRAYS = ("indptr", "indices", "data", "shape", "features", "node_ids")
+
+
+def graph_files(directory):
+    """Paths of the .npy files of the graph stored in directory."""
+    return [os.path.join(directory, name + ".npy") for name in ARRAYS]
+
+
+def save_graph(directory, adj, features, node_ids=None):
+    """Store adj (any scipy.sparse matrix), features and node ids (row i of
+    adj is node node_ids[i], by default i) as .npy files in directory."""
+    adj = sp.csr_matrix(adj)
+    if node_ids is None:
+        node_ids = np.arange(adj.shape[0])
+
+    # Index dtype scipy picks itself, so loading does not need to convert
+    if max(adj.nnz, *adj.shape) < 2 ** 31:
+        index_dtype = np.int32
+    else:
+        index_dtype = np.int64
+
+    arrays = {
+        "indptr": adj.indptr.astype(index_dtype, copy=False),
+        "indices": adj.indices.astype(index_dtype, copy=False),
+        "data": adj.data,
+        "shape": np.array(adj.shape, dtype=np.int64),
+        "features": np.asarray(features),
+        "node_ids": np.asarray(node_ids),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    for name, path in zip(ARRAYS, graph_files(directory)):
+        np.save(path, arrays[name], allow_pickle=False)
+
+
+def load_graph(directory, mmap_mode="r"):
+    """Load (adj, features, node_ids) stored by save_graph.
+
+    With the default mmap_mode="r" the arrays are read-only memory maps and
+    adj is a CSR matrix built on them without copying.
+    """
+    arrays = {
+        name: np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        for name, path in zip(ARRAYS, graph_files(directory))
+    }
+
+    adj = sp.csr_matrix(
+        (arrays["data"], arrays["indices"], arrays["indptr"]),
+        shape=tuple(int(size) for size in arrays["shape"]),
+        copy=False,
+    )
+
+    return adj, arrays["features"], arrays["node_ids"]
+
+
+def legacy_node_order(edges_path=EDGES_FILE, feats_path=FEATS_FILE):
+    """Node ids of the rows of a pickle written by the networkx version of
+    generate_graph.py. networkx numbered the nodes in insertion order: as
+    first seen in the edge list, then the root 0, then the nodes of the
+    features file without edges. Returns the node ids and the edges."""
+    edges = np.loadtxt(
+        edges_path, delimiter=",", usecols=(0, 1), dtype=np.int64, ndmin=2
+    )
+    feature_ids = np.loadtxt(
+        feats_path,
+        delimiter=",",
+        skiprows=1,
+        usecols=0,
+        dtype=np.int64,
+        ndmin=1,
+    )
+
+    ids = np.concatenate([edges.ravel(), [0], feature_ids])
+    _, first = np.unique(ids, return_index=True)
+
+    return ids[np.sort(first)], edges
+
+
+def has_edges(adj, node_ids, edges):
+    """Whether every edge of the edge list is in adj when row i of adj is
+    node node_ids[i]."""
+    rows = np.empty(node_ids.max() + 1, dtype=np.int64)
+    rows[node_ids] = np.arange(len(node_ids))
+
+    return not len(edges) or np.all(adj[rows[edges[:, 0]], rows[edges[:, 1]]])
+
+
+def convert_pickle(
+    pickle_path,
+    directory,
+    edges_path=EDGES_FILE,
+    feats_path=FEATS_FILE,
+    nodes_path=NODES_FILE,
+):
+    """Convert a pickled (adj, features) tuple written by generate_graph.py
+    to the binary graph format. The node ids of its rows are recovered from
+    the edges and features files it was built from (and are the indices of
+    the labels of nodes.csv): they are sorted in a pickle of the current
+    version and in networkx order in one of the networkx version."""
+    with open(pickle_path, "rb") as file:
+        adj, features = pickle.load(file)
+    adj = sp.csr_matrix(adj)
+
+    node_ids, edges = legacy_node_order(edges_path, feats_path)
+    if len(node_ids) != adj.shape[0]:
+        raise ValueError(
+            "{} has {} nodes, {} and {} have {}".format(
+                pickle_path,
+                adj.shape[0],
+                edges_path,
+                feats_path,
+                len(node_ids),
+            )
+        )
+    if os.path.exists(nodes_path):
+        with open(nodes_path) as file:
+            num_labels = sum(1 for _ in csv.reader(file)) - 1
+        if node_ids.max() >= num_labels:
+            raise ValueError(
+                "{} has no label for node {}".format(
+                    nodes_path, node_ids.max()
+                )
+            )
+
+    # Every edge of the edge list must be in the pickled graph
+    if has_edges(adj, np.sort(node_ids), edges):
+        node_ids = np.sort(node_ids)
+    elif not has_edges(adj, node_ids, edges):
+        raise ValueError(
+            "{} was not built from {}".format(pickle_path, edges_path)
+        )
+
+    save_graph(directory, adj, features, node_ids)
+
+
+if __name__ == "__main__":
+    convert_pickle(
+        sys.argv[1] if len(sys.argv) > 1 else PICKLE_FILE,
+        sys.argv[2] if len(sys.argv) > 2 else GRAPH_DIR,
+    )
@@ -9,16 +9,49 @@ Knowledge Discovery and Data Mining (KDD), 2016
 
 import numpy as np
 import networkx as nx
+import multiprocessing
 import random
+import scipy.sparse as sp
+import time
+
+from multiprocessing import shared_memory
+
+# Number of start nodes walked together by one seeded task
+WALK_CHUNK_SIZE = 4096
 
 
 class Graph:
     def __init__(self, nx_G, is_directed, p, q):
-        self.G = nx_G
+        self._G = nx_G
+        self._adj = None
         self.is_directed = is_directed
         self.p = p
         self.q = q
 
+    @classmethod
+    def from_sparse(cls, adj, is_directed, p, q):
+        """Create a graph from a scipy.sparse adjacency matrix (node i is
+           row i). The CSR arrays are taken from the matrix directly and the
+           networkx graph is only built if something asks for G.
+        """
+
+        graph = cls(None, is_directed, p, q)
+        graph._adj = _canonical_csr(adj)
+
+        return graph
+
+    @property
+    def G(self):
+        """The networkx graph, built from the sparse matrix on first use."""
+
+        if self._G is None:
+            create_using = nx.DiGraph() if self.is_directed else nx.Graph()
+            self._G = nx.from_scipy_sparse_matrix(
+                self._adj, create_using=create_using
+            )
+
+        return self._G
+
     def node2vec_walk(self, walk_length, start_node):
         """Simulate a random walk starting from start node."""
 
@@ -54,8 +87,27 @@ class Graph:
 
         return walk
 
-    def simulate_walks(self, num_walks, walk_length, verbose=True):
-        """Repeatedly simulate random walks from each node."""
+    def simulate_walks(
+        self,
+        num_walks,
+        walk_length,
+        verbose=True,
+        engine="python",
+        workers=1,
+        seed=None,
+    ):
+        """Repeatedly simulate random walks from each node.
+
+        With engine="csr" the walks are advanced in batches over the
+        compiled CSR arrays (see compile_csr) instead of one networkx lookup
+        per step. Both engines sample from the same distribution. workers
+        and seed are only used by the CSR engine, see walk_matrix.
+        """
+
+        if engine == "csr":
+            return self.simulate_walks_csr(
+                num_walks, walk_length, verbose, workers, seed
+            )
 
         G = self.G
         walks = []
@@ -75,6 +127,284 @@ class Graph:
 
         return walks
 
+    def simulate_walks_csr(
+        self, num_walks, walk_length, verbose=True, workers=1, seed=None
+    ):
+        """Simulate random walks from each node with the CSR engine."""
+
+        batch = self.walk_matrix(
+            num_walks, walk_length, verbose, workers, seed
+        )
+        lengths = (batch >= 0).sum(axis=1)
+
+        walks = []
+        for walk, length in zip(batch, lengths):
+            walks.append(self.nodes[walk[:length]].tolist())
+
+        return walks
+
+    def walk_matrix(
+        self, num_walks, walk_length, verbose=True, workers=1, seed=None
+    ):
+        """Simulate num_walks walks from each node into an int32 matrix.
+
+        Rows hold CSR node indices (see csr_walks), one pass over the nodes
+        after the other. See iter_walk_batches for workers and seed.
+        """
+
+        walks = None
+        batches = self.iter_walk_batches(
+            num_walks, walk_length, verbose, workers, seed
+        )
+        for walk_iter, batch in enumerate(batches):
+            if walks is None:
+                walks = np.empty(
+                    (num_walks * len(batch), walk_length), dtype=np.int32
+                )
+            lo = walk_iter * len(batch)
+            walks[lo : lo + len(batch)] = batch
+
+        if walks is None:
+            walks = np.empty((0, walk_length), dtype=np.int32)
+
+        return walks
+
+    def iter_walk_batches(
+        self,
+        num_walks,
+        walk_length,
+        verbose=True,
+        workers=1,
+        seed=None,
+        starts=None,
+    ):
+        """Yield one int32 walk matrix per shuffled pass over the nodes.
+
+        Without a seed and with a single worker the global NumPy random
+        state is used. Otherwise start nodes are split into fixed-size
+        chunks, each with its own generator derived from seed, so the walks
+        are the same for any number of workers. workers > 1 runs the chunks
+        in a process pool that reads the compiled arrays from shared memory.
+        starts (CSR node indices) restricts the walks to those start nodes.
+        """
+
+        if not hasattr(self, "indptr"):
+            self.compile_csr()
+
+        arrays = self.csr_arrays()
+        if starts is None:
+            starts = np.arange(len(self.nodes))
+        starts = np.asarray(starts, dtype=np.int64)
+        num_starts = len(starts)
+
+        if workers == 1 and seed is None:
+            if verbose == True:
+                print("Walk iteration:")
+            for walk_iter in range(num_walks):
+                if verbose == True:
+                    print(str(walk_iter + 1), "/", str(num_walks))
+                order = np.random.permutation(starts)
+                yield csr_walks(arrays, order, walk_length, self.p, self.q)
+            return
+
+        entropy = np.random.SeedSequence(seed).entropy
+        if verbose == True:
+            print(
+                "Simulating {} walks on {} worker(s)".format(
+                    num_walks * num_starts, workers
+                )
+            )
+
+        if workers == 1:
+            for walk_iter in range(num_walks):
+                walks = np.empty((num_starts, walk_length), dtype=np.int32)
+                for task in _walk_tasks(starts, walk_iter, entropy):
+                    _run_walk_task(
+                        arrays, walks, walk_length, self.p, self.q, task
+                    )
+                yield walks
+            return
+
+        arrays["walks"] = np.empty((num_starts, walk_length), dtype=np.int32)
+        spec, blocks, views = _share_arrays(arrays)
+        try:
+            with multiprocessing.Pool(
+                workers,
+                initializer=_attach_shared,
+                initargs=(spec, walk_length, self.p, self.q),
+            ) as pool:
+                for walk_iter in range(num_walks):
+                    tasks = _walk_tasks(starts, walk_iter, entropy)
+                    for _ in pool.imap_unordered(_walk_task, tasks):
+                        pass
+                    yield views["walks"].copy()
+        finally:
+            views.clear()
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def iter_walks(
+        self,
+        num_walks,
+        walk_length,
+        verbose=True,
+        workers=1,
+        seed=None,
+        starts=None,
+    ):
+        """Lazily yield walks as lists of node tokens (str), e.g. for
+           Word2Vec. Only one pass over the nodes is held in memory.
+        """
+
+        batches = self.iter_walk_batches(
+            num_walks, walk_length, verbose, workers, seed, starts
+        )
+
+        return walk_tokens(batches, self.nodes)
+
+    def write_walks(
+        self,
+        path,
+        num_walks,
+        walk_length,
+        verbose=True,
+        workers=1,
+        seed=None,
+        starts=None,
+    ):
+        """Write walks to path in LineSentence format (one walk per line,
+           space-separated node tokens), which gensim can stream from disk.
+        """
+
+        with open(path, "w") as file:
+            walks = self.iter_walks(
+                num_walks, walk_length, verbose, workers, seed, starts
+            )
+            for walk in walks:
+                file.write(" ".join(walk))
+                file.write("\n")
+
+        return
+
+    def compile_csr(self):
+        """Compile the graph and its alias tables into flat CSR arrays.
+
+        Nodes are numbered in sorted order and every row lists its
+        neighbors sorted, which is the order node2vec_walk indexes the alias
+        tables with. The alias table of edge (prev, cur) is stored at
+        edge_ptr[e]:edge_ptr[e + 1], where e is the CSR offset of the edge.
+        """
+
+        if hasattr(self, "edge_ptr"):
+            return
+
+        alias_nodes = self.alias_nodes
+        alias_edges = self.alias_edges
+
+        self.build_csr()
+        nodes = self.nodes.tolist()
+        indptr = self.indptr
+        indices = self.indices
+
+        node_J = []
+        node_q = []
+        edge_J = []
+        edge_q = []
+        for idx, node in enumerate(nodes):
+            if indptr[idx + 1] > indptr[idx]:
+                node_J.append(alias_nodes[node][0])
+                node_q.append(alias_nodes[node][1])
+            for nbr in indices[indptr[idx] : indptr[idx + 1]]:
+                edge = (node, nodes[nbr])
+                edge_J.append(alias_edges[edge][0])
+                edge_q.append(alias_edges[edge][1])
+
+        self.node_J = _concat(node_J, np.int32)
+        self.node_q = _concat(node_q, np.float64)
+        self.edge_ptr = self._edge_table_offsets()
+        self.edge_J = _concat(edge_J, np.int32)
+        self.edge_q = _concat(edge_q, np.float64)
+
+        return
+
+    def build_csr(self):
+        """Build the CSR structure (indptr, indices, weights) of the graph."""
+
+        if self._adj is not None:
+            adj = self._adj
+            nodes = np.arange(adj.shape[0])
+            indptr = adj.indptr.astype(np.int64)
+            self.nodes = nodes
+            self.indptr = indptr
+            self.indices = adj.indices.astype(np.int32)
+            self.weights = adj.data.astype(np.float64)
+        else:
+            G = self.G
+
+            nodes = sorted(G.nodes())
+            index = {node: idx for idx, node in enumerate(nodes)}
+
+            indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            indices = []
+            weights = []
+            for idx, node in enumerate(nodes):
+                nbrs = sorted(G.neighbors(node))
+                indptr[idx + 1] = indptr[idx] + len(nbrs)
+                indices.extend(index[nbr] for nbr in nbrs)
+                weights.extend(G[node][nbr]["weight"] for nbr in nbrs)
+
+            self.nodes = np.array(nodes)
+            self.indptr = indptr
+            self.indices = np.array(indices, dtype=np.int32)
+            self.weights = np.array(weights, dtype=np.float64)
+
+        # Rows used to answer has_edge(x, node): the in-neighbors of node
+        if self.is_directed:
+            order = np.argsort(self.indices, kind="stable")
+            sources = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+            self.rev_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.indices, minlength=len(nodes)),
+                out=self.rev_indptr[1:],
+            )
+            self.rev_indices = sources[order].astype(np.int32)
+        else:
+            self.rev_indptr = self.indptr
+            self.rev_indices = self.indices
+
+        return
+
+    def _edge_table_offsets(self, max_table_degree=None):
+        """Offsets of the per-edge alias tables, one table per CSR edge.
+
+        Edges into nodes with more than max_table_degree neighbors get an
+        empty table and are sampled lazily by the CSR engine.
+        """
+
+        sizes = np.diff(self.indptr)[self.indices]
+        if max_table_degree is not None:
+            sizes[sizes > max_table_degree] = 0
+        edge_ptr = np.zeros(len(self.indices) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=edge_ptr[1:])
+
+        return edge_ptr
+
+    def csr_arrays(self):
+        """Return the compiled arrays used by csr_walks."""
+
+        return {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "node_J": self.node_J,
+            "node_q": self.node_q,
+            "edge_ptr": self.edge_ptr,
+            "edge_J": self.edge_J,
+            "edge_q": self.edge_q,
+            "rev_indptr": self.rev_indptr,
+            "rev_indices": self.rev_indices,
+        }
+
     def get_alias_edge(self, src, dst):
         """Get the alias edge setup lists for a given edge."""
 
@@ -97,11 +427,130 @@ class Graph:
 
         return alias_setup(normalized_probs)
 
-    def preprocess_transition_probs(self):
+    def preprocess_transition_probs(
+        self, flat=False, max_table_degree=None, verbose=False
+    ):
         """Preprocessing of transition probabilities for guiding the random
            walks.
+
+        With flat=True the alias tables are built directly into the flat
+        arrays used by the CSR engine instead of per-edge dictionaries, and
+        only simulate_walks(engine="csr") can be used afterwards. The time
+        taken and the bytes held by the tables are kept in preprocess_stats.
+
+        max_table_degree (flat mode only) skips the edge tables of edges
+        pointing into nodes of higher degree; their steps are drawn by
+        rejection sampling instead, so 0 keeps memory at O(|E|). When
+        p == q == 1 every proposal is accepted and no edge table is built.
         """
 
+        if max_table_degree is not None and not flat:
+            raise ValueError("max_table_degree requires flat=True")
+
+        start = time.perf_counter()
+        if flat:
+            if self.p == 1 and self.q == 1:
+                max_table_degree = 0
+            self._preprocess_flat(max_table_degree)
+            arrays = {id(a): a for a in self.csr_arrays().values()}
+            nbytes = sum(array.nbytes for array in arrays.values())
+        else:
+            self._preprocess_dicts()
+            nbytes = sum(
+                J.nbytes + q.nbytes
+                for tables in (self.alias_nodes, self.alias_edges)
+                for J, q in tables.values()
+            )
+
+        self.preprocess_stats = {
+            "seconds": time.perf_counter() - start,
+            "bytes": nbytes,
+        }
+        if verbose == True:
+            print(
+                "Preprocessed transition probabilities in",
+                "{:.2f}s,".format(self.preprocess_stats["seconds"]),
+                "{:.1f} MB".format(nbytes / 2 ** 20),
+            )
+
+        return
+
+    def update(self, adj):
+        """Replace the graph by adj and rebuild only the alias tables that
+           changed. Returns the affected nodes.
+
+        adj is the new adjacency matrix with the old nodes as its first
+        rows (new nodes are appended). Requires a graph created with
+        from_sparse and preprocessed with flat=True. A node is affected when
+        an edge from or to it was added, removed or reweighted; the tables
+        of its edges and of the edges into it are rebuilt and all other
+        tables are copied from their old CSR offsets.
+        """
+
+        if self._adj is None or not hasattr(self, "max_table_degree"):
+            raise ValueError(
+                "update requires from_sparse and flat preprocessing"
+            )
+
+        old_adj = self._adj
+        old_indptr = self.indptr
+        old_edge_ptr = self.edge_ptr
+        old_tables = (self.node_J, self.node_q, self.edge_J, self.edge_q)
+        num_old = old_adj.shape[0]
+
+        self._adj = _canonical_csr(adj)
+        self._G = None
+        self.build_csr()
+        num_nodes = len(self.nodes)
+        if num_nodes < num_old:
+            raise ValueError("update cannot remove nodes")
+
+        # Endpoints of changed entries and the new nodes
+        old_adj = old_adj.copy()
+        old_adj.resize((num_nodes, num_nodes))
+        changed = (self._adj != old_adj).tocoo()
+        affected = np.zeros(num_nodes, dtype=bool)
+        affected[changed.row] = True
+        affected[changed.col] = True
+        affected[num_old:] = True
+
+        # Unaffected rows are unchanged, so their edges keep their position
+        # within the row
+        rows = np.repeat(np.arange(num_nodes), np.diff(self.indptr))
+        kept = ~affected[rows]
+        old_pos = np.zeros(len(self.indices), dtype=np.int64)
+        old_pos[kept] = (
+            np.arange(len(self.indices))[kept]
+            - self.indptr[rows[kept]]
+            + old_indptr[rows[kept]]
+        )
+
+        self.node_J = np.zeros(len(self.indices), dtype=np.int32)
+        self.node_q = np.zeros(len(self.indices), dtype=np.float64)
+        self.node_J[kept] = old_tables[0][old_pos[kept]]
+        self.node_q[kept] = old_tables[1][old_pos[kept]]
+        self._fill_node_tables(np.flatnonzero(affected))
+
+        # Edge tables depend on both endpoints
+        self.edge_ptr = self._edge_table_offsets(self.max_table_degree)
+        self.edge_J = np.zeros(self.edge_ptr[-1], dtype=np.int32)
+        self.edge_q = np.zeros(self.edge_ptr[-1], dtype=np.float64)
+        kept &= ~affected[self.indices]
+        sizes = np.diff(self.edge_ptr)[kept]
+        starts = np.repeat(old_edge_ptr[old_pos[kept]], sizes)
+        offsets = np.arange(sizes.sum()) - np.repeat(
+            np.cumsum(sizes) - sizes, sizes
+        )
+        slots = np.repeat(self.edge_ptr[:-1][kept], sizes) + offsets
+        self.edge_J[slots] = old_tables[2][starts + offsets]
+        self.edge_q[slots] = old_tables[3][starts + offsets]
+        self._fill_edge_tables(np.flatnonzero(~kept))
+
+        return np.flatnonzero(affected)
+
+    def _preprocess_dicts(self):
+        """Build one alias table per node and per edge in dictionaries."""
+
         G = self.G
         is_directed = self.is_directed
 
@@ -134,6 +583,79 @@ class Graph:
 
         return
 
+    def _preprocess_flat(self, max_table_degree=None):
+        """Build all alias tables into flat arrays indexed by CSR offset."""
+
+        self.build_csr()
+        num_nodes = len(self.indptr) - 1
+
+        self.node_J = np.zeros(len(self.indices), dtype=np.int32)
+        self.node_q = np.zeros(len(self.indices), dtype=np.float64)
+        self._fill_node_tables(np.arange(num_nodes))
+
+        self.max_table_degree = max_table_degree
+        self.edge_ptr = self._edge_table_offsets(max_table_degree)
+        self.edge_J = np.zeros(self.edge_ptr[-1], dtype=np.int32)
+        self.edge_q = np.zeros(self.edge_ptr[-1], dtype=np.float64)
+        self._fill_edge_tables(np.arange(len(self.indices)))
+
+        return
+
+    def _fill_node_tables(self, nodes):
+        """Build the first-order alias tables of nodes into node_J/node_q."""
+
+        indptr = self.indptr
+        weights = self.weights
+
+        for node in nodes:
+            lo, hi = indptr[node], indptr[node + 1]
+            if hi > lo:
+                alias_setup_into(
+                    weights[lo:hi], self.node_J[lo:hi], self.node_q[lo:hi]
+                )
+
+        return
+
+    def _fill_edge_tables(self, edges):
+        """Build the alias tables of edges (CSR offsets, sorted) into
+           edge_J/edge_q. Edges without a table in edge_ptr are skipped.
+        """
+
+        p = self.p
+        q = self.q
+        indptr = self.indptr
+        indices = self.indices
+        weights = self.weights
+        rev_indptr = self.rev_indptr
+        rev_indices = self.rev_indices
+        edge_ptr = self.edge_ptr
+
+        edges = edges[edge_ptr[edges + 1] > edge_ptr[edges]]
+        sources = np.searchsorted(indptr, edges, side="right") - 1
+        for src, edge in zip(sources, edges):
+            src_nbrs = rev_indices[rev_indptr[src] : rev_indptr[src + 1]]
+            dst = indices[edge]
+            lo, hi = indptr[dst], indptr[dst + 1]
+            dst_nbrs = indices[lo:hi]
+
+            # Sorted-neighbor intersection: dst_nbr -> src edges get 1
+            if len(src_nbrs) > 0:
+                pos = np.searchsorted(src_nbrs, dst_nbrs)
+                pos = np.minimum(pos, len(src_nbrs) - 1)
+                common = src_nbrs[pos] == dst_nbrs
+            else:
+                common = np.zeros(len(dst_nbrs), dtype=bool)
+            bias = np.where(common, 1.0, 1.0 / q)
+            bias[dst_nbrs == src] = 1.0 / p
+
+            alias_setup_into(
+                weights[lo:hi] * bias,
+                self.edge_J[edge_ptr[edge] : edge_ptr[edge + 1]],
+                self.edge_q[edge_ptr[edge] : edge_ptr[edge + 1]],
+            )
+
+        return
+
 
 def alias_setup(probs):
     """Compute utility lists for non-uniform sampling from discrete
@@ -169,6 +691,31 @@ def alias_setup(probs):
     return J, q
 
 
+def alias_setup_into(weights, J, q):
+    """Build the alias table of unnormalized weights into J and q in place.
+
+    Same construction as alias_setup, writing into slices of the flat
+    arrays used by the CSR engine instead of allocating new ones.
+    """
+    K = len(weights)
+    q[:] = K * (weights / weights.sum())
+    J[:] = 0
+
+    smaller = np.flatnonzero(q < 1.0).tolist()
+    larger = np.flatnonzero(q >= 1.0).tolist()
+
+    while len(smaller) > 0 and len(larger) > 0:
+        small = smaller.pop()
+        large = larger.pop()
+
+        J[small] = large
+        q[large] = q[large] + q[small] - 1.0
+        if q[large] < 1.0:
+            smaller.append(large)
+        else:
+            larger.append(large)
+
+
 def alias_draw(J, q):
     """Draw sample from a non-uniform discrete distribution using alias
        sampling.
@@ -180,3 +727,293 @@ def alias_draw(J, q):
         return kk
     else:
         return J[kk]
+
+
+class WalkCorpus:
+    """Re-iterable corpus of node2vec walks for Word2Vec.
+
+    Walks are regenerated lazily on every pass instead of being kept in
+    memory. The seed is fixed on construction, so each pass (vocabulary
+    scan and every training epoch) sees exactly the same walks. With
+    keep=True the compact int32 walk matrices of the first pass are kept
+    and replayed, e.g. to train several models on the same walks.
+    """
+
+    def __init__(
+        self, graph, num_walks, walk_length, workers=1, seed=None, keep=False
+    ):
+        self.graph = graph
+        self.num_walks = num_walks
+        self.walk_length = walk_length
+        self.workers = workers
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.keep = keep
+        self.batches = None
+
+    def __iter__(self):
+        batches = self.batches
+        if batches is None:
+            batches = self.graph.iter_walk_batches(
+                self.num_walks,
+                self.walk_length,
+                verbose=False,
+                workers=self.workers,
+                seed=self.seed,
+            )
+            if self.keep:
+                self.batches = batches = list(batches)
+
+        return walk_tokens(batches, self.graph.nodes)
+
+
+def walk_tokens(batches, nodes):
+    """Yield the walks of int32 walk matrices as lists of node tokens."""
+    tokens = nodes.astype(str)
+    for batch in batches:
+        lengths = (batch >= 0).sum(axis=1)
+        for walk, length in zip(batch, lengths):
+            yield tokens[walk[:length]].tolist()
+
+
+def csr_walks(arrays, starts, walk_length, p=1, q=1, rng=np.random):
+    """Simulate one walk per start index, advancing all walkers together.
+
+    Returns an int32 matrix of node indices with one row per walk. A walk
+    that reaches a node without neighbors stops early and the rest of its
+    row is filled with -1. Edges without a precomputed alias table are
+    sampled by rejection against the first-order node tables.
+    """
+    indptr = arrays["indptr"]
+    indices = arrays["indices"]
+    edge_ptr = arrays["edge_ptr"]
+
+    starts = np.asarray(starts, dtype=np.int64)
+    walks = np.full((len(starts), walk_length), -1, dtype=np.int32)
+    if walk_length == 0:
+        return walks
+    walks[:, 0] = starts
+
+    active = np.arange(len(starts))
+    cur = starts
+    prev = None
+    edge = None
+    for step in range(1, walk_length):
+        degrees = indptr[cur + 1] - indptr[cur]
+        alive = degrees > 0
+        if not alive.all():
+            active = active[alive]
+            cur = cur[alive]
+            degrees = degrees[alive]
+            if edge is not None:
+                prev = prev[alive]
+                edge = edge[alive]
+        if len(active) == 0:
+            break
+
+        # First step is first-order, later steps depend on the last edge
+        if edge is None:
+            choice = _alias_draw_batch(
+                arrays["node_J"], arrays["node_q"], indptr[cur], degrees, rng
+            )
+        else:
+            choice = np.empty(len(cur), dtype=np.int64)
+            tabled = edge_ptr[edge + 1] - edge_ptr[edge] == degrees
+            if tabled.any():
+                choice[tabled] = _alias_draw_batch(
+                    arrays["edge_J"],
+                    arrays["edge_q"],
+                    edge_ptr[edge[tabled]],
+                    degrees[tabled],
+                    rng,
+                )
+            lazy = ~tabled
+            if lazy.any():
+                choice[lazy] = _rejection_draw(
+                    arrays, prev[lazy], cur[lazy], degrees[lazy], p, q, rng
+                )
+
+        prev = cur
+        edge = indptr[cur] + choice
+        cur = indices[edge].astype(np.int64)
+        walks[active, step] = cur
+
+    return walks
+
+
+def _alias_draw_batch(J, q, offsets, sizes, rng):
+    """Draw one sample from each alias table stored at J/q[offset:+size]."""
+    kk = (rng.random(len(offsets)) * sizes).astype(np.int64)
+    slots = offsets + kk
+    return np.where(rng.random(len(offsets)) < q[slots], kk, J[slots])
+
+
+def _rejection_draw(arrays, prev, cur, degrees, p, q, rng):
+    """Draw second-order steps by rejection against first-order tables.
+
+    A neighbor x of cur proposed with probability proportional to its edge
+    weight is accepted with probability bias(x) / max(bias), where bias is
+    1/p for x == prev, 1 when x -> prev is an edge and 1/q otherwise. The
+    accepted samples follow the same distribution as get_alias_edge.
+    """
+    indptr = arrays["indptr"]
+    indices = arrays["indices"]
+
+    bias = np.array([1.0 / p, 1.0, 1.0 / q])
+    bound = bias.max()
+
+    choice = np.zeros(len(cur), dtype=np.int64)
+    pending = np.arange(len(cur))
+    while len(pending) > 0:
+        offsets = indptr[cur[pending]]
+        draw = _alias_draw_batch(
+            arrays["node_J"], arrays["node_q"], offsets, degrees[pending], rng
+        )
+        proposal = indices[offsets + draw]
+        src = prev[pending]
+        kind = np.where(
+            _csr_contains(
+                arrays["rev_indptr"], arrays["rev_indices"], src, proposal
+            ),
+            1,
+            2,
+        )
+        kind[proposal == src] = 0
+
+        accept = rng.random(len(pending)) * bound < bias[kind]
+        choice[pending[accept]] = draw[accept]
+        pending = pending[~accept]
+
+    return choice
+
+
+def _csr_contains(indptr, indices, rows, values):
+    """Vectorized binary search of values[i] in sorted row rows[i]."""
+    lo = indptr[rows].astype(np.int64)
+    end = indptr[rows + 1].astype(np.int64)
+    hi = end.copy()
+    last = max(len(indices) - 1, 0)
+
+    searching = lo < hi
+    while searching.any():
+        mid = (lo + hi) // 2
+        right = searching & (indices[np.minimum(mid, last)] < values)
+        lo = np.where(right, mid + 1, lo)
+        hi = np.where(searching & ~right, mid, hi)
+        searching = lo < hi
+
+    if len(indices) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    return (lo < end) & (indices[np.minimum(lo, last)] == values)
+
+
+def _walk_tasks(starts, walk_iter, entropy):
+    """Split one shuffled pass over the start nodes into seeded chunks.
+
+    Every chunk is (row offset, start indices, entropy, spawn key); the
+    start order and each chunk's generator depend only on the entropy of
+    the master seed and the pass number.
+    """
+    order = np.random.default_rng(
+        np.random.SeedSequence(entropy, spawn_key=(walk_iter,))
+    )
+    starts = order.permutation(starts)
+
+    tasks = []
+    for chunk, lo in enumerate(range(0, len(starts), WALK_CHUNK_SIZE)):
+        tasks.append(
+            (
+                lo,
+                starts[lo : lo + WALK_CHUNK_SIZE],
+                entropy,
+                (walk_iter, chunk),
+            )
+        )
+
+    return tasks
+
+
+def _run_walk_task(arrays, out, walk_length, p, q, task):
+    """Simulate one chunk of walks into its rows of out."""
+    offset, starts, entropy, spawn_key = task
+    rng = np.random.default_rng(
+        np.random.SeedSequence(entropy, spawn_key=spawn_key)
+    )
+    out[offset : offset + len(starts)] = csr_walks(
+        arrays, starts, walk_length, p, q, rng
+    )
+
+
+def _share_arrays(arrays):
+    """Copy arrays into shared memory blocks.
+
+    Returns a picklable spec of (block name, shape, dtype) per array, the
+    blocks (which the caller must close and unlink) and the shared views.
+    Arrays that are the same object share a block.
+    """
+    spec = {}
+    blocks = {}
+    views = {}
+    for name, array in arrays.items():
+        if id(array) not in blocks:
+            block = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            view = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            view[:] = array
+            blocks[id(array)] = (block, view)
+        block, view = blocks[id(array)]
+        spec[name] = (block.name, array.shape, array.dtype.str)
+        views[name] = view
+
+    return spec, [block for block, _ in blocks.values()], views
+
+
+# Per-process state of walk workers, set up by _attach_shared
+_worker = {}
+
+
+def _attach_shared(spec, walk_length, p, q):
+    """Pool initializer: map the shared arrays into this worker."""
+    blocks = {}
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        if block_name not in blocks:
+            blocks[block_name] = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(
+            shape, np.dtype(dtype), buffer=blocks[block_name].buf
+        )
+
+    _worker.update(
+        blocks=blocks, arrays=arrays, walk_length=walk_length, p=p, q=q
+    )
+
+
+def _walk_task(task):
+    """Pool task: simulate one chunk into the shared walk matrix."""
+    _run_walk_task(
+        _worker["arrays"],
+        _worker["arrays"]["walks"],
+        _worker["walk_length"],
+        _worker["p"],
+        _worker["q"],
+        task,
+    )
+
+
+def _canonical_csr(adj):
+    """adj as CSR without explicit zeros and with sorted indices."""
+    adj = sp.csr_matrix(adj)
+    if (adj.data == 0).any() or not adj.has_sorted_indices:
+        # Copy first, adj may share read-only (memory-mapped) arrays
+        adj = adj.copy()
+        adj.eliminate_zeros()
+        adj.sort_indices()
+
+    return adj
+
+
+def _concat(arrays, dtype):
+    """Concatenate a list of arrays, allowing the list to be empty."""
+    if len(arrays) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
@@ -2,6 +2,8 @@ import networkx as nx
 import numpy as np
 import scipy.sparse as sp
 
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+
 
 # Convert sparse matrix to tuple
 def sparse_to_tuple(sparse_mx):
@@ -42,8 +44,14 @@ def construct_feed_dict(adj_normalized, adj, features, placeholders):
 # Takes in adjacency matrix in sparse format
 # Returns: adj_train, train_edges, val_edges, val_edges_false,
 # test_edges, test_edges_false
+# With spanning_tree=True, the split is done by mask_test_edges_sparse
 def mask_test_edges(
-    adj, test_frac=0.1, val_frac=0.05, prevent_disconnect=True, verbose=False
+    adj,
+    test_frac=0.1,
+    val_frac=0.05,
+    prevent_disconnect=True,
+    verbose=False,
+    spanning_tree=False,
 ):
     # NOTE: Splits are randomized and results might slightly deviate from reported numbers in the paper.
 
@@ -56,7 +64,12 @@ def mask_test_edges(
     )
     adj.eliminate_zeros()
     # Check that diag is zero:
-    assert np.diag(adj.todense()).sum() == 0
+    assert adj.diagonal().sum() == 0
+
+    if spanning_tree == True:
+        return mask_test_edges_sparse(
+            adj, test_frac, val_frac, prevent_disconnect, verbose
+        )
 
     g = nx.from_scipy_sparse_matrix(adj)
     orig_num_cc = nx.number_connected_components(g)
@@ -78,7 +91,6 @@ def mask_test_edges(
     edge_tuples = [
         (min(edge[0], edge[1]), max(edge[0], edge[1])) for edge in edges
     ]
-    all_edge_tuples = set(edge_tuples)
     train_edges = set(edge_tuples)  # initialize train_edges to have all edges
     test_edges = set()
     val_edges = set()
@@ -132,109 +144,256 @@ def mask_test_edges(
     if prevent_disconnect == True:
         assert nx.number_connected_components(g) == orig_num_cc
 
-    if verbose == True:
-        print("creating false test edges...")
+    (
+        train_edges_false,
+        val_edges_false,
+        test_edges_false,
+    ) = sample_false_edges(
+        adj.shape[0], edges, len(train_edges), num_val, num_test, verbose
+    )
 
-    test_edges_false = set()
-    while len(test_edges_false) < num_test:
-        idx_i = np.random.randint(0, adj.shape[0])
-        idx_j = np.random.randint(0, adj.shape[0])
-        if idx_i == idx_j:
-            continue
+    # assert: test, val, train positive edges disjoint
+    assert val_edges.isdisjoint(train_edges)
+    assert test_edges.isdisjoint(train_edges)
+    assert val_edges.isdisjoint(test_edges)
 
-        false_edge = (min(idx_i, idx_j), max(idx_i, idx_j))
+    if verbose == True:
+        print("creating adj_train...")
 
-        # Make sure false_edge not an actual edge, and not a repeat
-        if false_edge in all_edge_tuples:
-            continue
-        if false_edge in test_edges_false:
-            continue
+    # Re-build adj matrix using remaining graph
+    adj_train = nx.adjacency_matrix(g)
 
-        test_edges_false.add(false_edge)
+    # Convert edge-lists to numpy arrays
+    train_edges = np.array([list(edge_tuple) for edge_tuple in train_edges])
+    val_edges = np.array([list(edge_tuple) for edge_tuple in val_edges])
+    test_edges = np.array([list(edge_tuple) for edge_tuple in test_edges])
 
     if verbose == True:
-        print("creating false val edges...")
+        print("Done with train-test split!")
+        print("")
 
-    val_edges_false = set()
-    while len(val_edges_false) < num_val:
-        idx_i = np.random.randint(0, adj.shape[0])
-        idx_j = np.random.randint(0, adj.shape[0])
-        if idx_i == idx_j:
-            continue
+    # NOTE: these edge lists only contain single direction of edge!
+    return (
+        adj_train,
+        train_edges,
+        train_edges_false,
+        val_edges,
+        val_edges_false,
+        test_edges,
+        test_edges_false,
+    )
+
+
+# Edges (node1 < node2) of an undirected graph that are not in a spanning
+# forest, found in near-linear time instead of one component count per edge
+def non_tree_edges(adj):
+    adj = sp.triu(adj, k=1).tocsr()
+    adj.data = np.ones_like(adj.data)
+    tree = minimum_spanning_tree(adj).tocoo()
+
+    edges = sparse_to_tuple(adj)[0]
+    tree_edges = np.sort(np.stack([tree.row, tree.col], axis=1), axis=1)
+    tree_keys = edge_keys(tree_edges, adj.shape[0])
+
+    return edges[~np.isin(edge_keys(edges, adj.shape[0]), tree_keys)]
+
+
+# Encode node pairs (node1 < node2) as single int64 keys node1 * N + node2
+def edge_keys(edges, num_nodes):
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    return edges[:, 0] * num_nodes + edges[:, 1]
+
+
+# Sample distinct node pairs (node1 < node2) whose keys are not in the
+# sorted array exclude_keys. Candidates are drawn and filtered in NumPy
+# blocks instead of one pair per iteration.
+# Returns: int64 array of shape (num_samples, 2)
+def sample_negative_edges(
+    num_nodes, num_samples, exclude_keys=None, batch_size=None
+):
+    if exclude_keys is None:
+        exclude_keys = np.zeros(0, dtype=np.int64)
+    num_pairs = num_nodes * (num_nodes - 1) // 2
+    if num_samples > num_pairs - len(exclude_keys):
+        raise ValueError(
+            "cannot sample {} negative edges, only {} node pairs are "
+            "available".format(num_samples, num_pairs - len(exclude_keys))
+        )
+    if batch_size is None:
+        batch_size = max(2 * num_samples, 1024)
+
+    keys = np.zeros(0, dtype=np.int64)
+    while len(keys) < num_samples:
+        idx_i = np.random.randint(0, num_nodes, batch_size)
+        idx_j = np.random.randint(0, num_nodes, batch_size)
+        keep = idx_i != idx_j
+        candidates = edge_keys(
+            np.stack(
+                [
+                    np.minimum(idx_i[keep], idx_j[keep]),
+                    np.maximum(idx_i[keep], idx_j[keep]),
+                ],
+                axis=1,
+            ),
+            num_nodes,
+        )
+
+        # Reject true/excluded edges, earlier samples and repeats, keeping
+        # the candidates in the order they were drawn
+        if len(exclude_keys) > 0:
+            pos = np.searchsorted(exclude_keys, candidates)
+            pos = np.minimum(pos, len(exclude_keys) - 1)
+            candidates = candidates[exclude_keys[pos] != candidates]
+        candidates = candidates[~np.isin(candidates, keys)]
+        _, first = np.unique(candidates, return_index=True)
+        candidates = candidates[np.sort(first)]
 
-        false_edge = (min(idx_i, idx_j), max(idx_i, idx_j))
+        keys = np.concatenate([keys, candidates[: num_samples - len(keys)]])
 
-        # Make sure false_edge in not an actual edge, not in test_edges_false, not a repeat
-        if (
-            false_edge in all_edge_tuples
-            or false_edge in test_edges_false
-            or false_edge in val_edges_false
-        ):
-            continue
+    return np.stack([keys // num_nodes, keys % num_nodes], axis=1)
 
-        val_edges_false.add(false_edge)
 
+# Sample train/val/test false edges that are disjoint from each other and
+# from the true edges (node1 < node2)
+# Returns: train_edges_false, val_edges_false, test_edges_false
+def sample_false_edges(
+    num_nodes, edges, num_train, num_val, num_test, verbose=False
+):
     if verbose == True:
-        print("creating false train edges...")
+        print("creating false test edges...")
 
-    train_edges_false = set()
-    while len(train_edges_false) < len(train_edges):
-        idx_i = np.random.randint(0, adj.shape[0])
-        idx_j = np.random.randint(0, adj.shape[0])
-        if idx_i == idx_j:
-            continue
+    # Sorted keys of every true edge, see edge_keys
+    true_keys = np.unique(edge_keys(edges, num_nodes))
 
-        false_edge = (min(idx_i, idx_j), max(idx_i, idx_j))
+    # Make sure false edges are not actual edges, not repeats and not in
+    # any other false edge set
+    test_edges_false = sample_negative_edges(num_nodes, num_test, true_keys)
+    test_false_keys = edge_keys(test_edges_false, num_nodes)
 
-        # Make sure false_edge in not an actual edge, not in test_edges_false,
-        # not in val_edges_false, not a repeat
-        if (
-            false_edge in all_edge_tuples
-            or false_edge in test_edges_false
-            or false_edge in val_edges_false
-            or false_edge in train_edges_false
-        ):
-            continue
+    if verbose == True:
+        print("creating false val edges...")
+
+    val_edges_false = sample_negative_edges(
+        num_nodes, num_val, np.union1d(true_keys, test_false_keys)
+    )
+    val_false_keys = edge_keys(val_edges_false, num_nodes)
+
+    if verbose == True:
+        print("creating false train edges...")
 
-        train_edges_false.add(false_edge)
+    train_edges_false = sample_negative_edges(
+        num_nodes,
+        num_train,
+        np.union1d(true_keys, np.union1d(test_false_keys, val_false_keys)),
+    )
+    train_false_keys = edge_keys(train_edges_false, num_nodes)
 
     if verbose == True:
         print("final checks for disjointness...")
 
     # assert: false_edges are actually false (not in all_edge_tuples)
-    assert test_edges_false.isdisjoint(all_edge_tuples)
-    assert val_edges_false.isdisjoint(all_edge_tuples)
-    assert train_edges_false.isdisjoint(all_edge_tuples)
+    assert not np.isin(test_false_keys, true_keys).any()
+    assert not np.isin(val_false_keys, true_keys).any()
+    assert not np.isin(train_false_keys, true_keys).any()
 
     # assert: test, val, train false edges disjoint
-    assert test_edges_false.isdisjoint(val_edges_false)
-    assert test_edges_false.isdisjoint(train_edges_false)
-    assert val_edges_false.isdisjoint(train_edges_false)
+    assert not np.isin(test_false_keys, val_false_keys).any()
+    assert not np.isin(test_false_keys, train_false_keys).any()
+    assert not np.isin(val_false_keys, train_false_keys).any()
+
+    return train_edges_false, val_edges_false, test_edges_false
 
-    # assert: test, val, train positive edges disjoint
-    assert val_edges.isdisjoint(train_edges)
-    assert test_edges.isdisjoint(train_edges)
-    assert val_edges.isdisjoint(test_edges)
 
+# Sparse-only train-test split: same result structure as mask_test_edges,
+# but held-out edges are sampled from the edges outside a spanning forest
+# and no networkx graph or dense matrix is ever built
+# Returns: adj_train, train_edges, train_edges_false, val_edges,
+# val_edges_false, test_edges, test_edges_false
+def mask_test_edges_sparse(
+    adj, test_frac=0.1, val_frac=0.05, prevent_disconnect=True, verbose=False
+):
     if verbose == True:
-        print("creating adj_train...")
+        print("preprocessing...")
 
-    # Re-build adj matrix using remaining graph
-    adj_train = nx.adjacency_matrix(g)
+    # Remove diagonal elements
+    adj = sp.csr_matrix(adj)
+    adj = adj - sp.dia_matrix(
+        (adj.diagonal()[np.newaxis, :], [0]), shape=adj.shape
+    )
+    adj.eliminate_zeros()
+    assert adj.diagonal().sum() == 0
 
-    # Convert edge-lists to numpy arrays
-    train_edges = np.array([list(edge_tuple) for edge_tuple in train_edges])
-    train_edges_false = np.array(
-        [list(edge_tuple) for edge_tuple in train_edges_false]
+    adj_triu = sp.triu(adj).tocoo()  # edges only 1 way
+    edges = np.stack([adj_triu.row, adj_triu.col], axis=1)
+    num_test = int(np.floor(edges.shape[0] * test_frac))
+    num_val = int(np.floor(edges.shape[0] * val_frac))
+
+    if verbose == True:
+        print("generating test/val sets...")
+
+    # Removing edges outside a spanning forest never disconnects a
+    # connected component, so they can all be held out at once
+    if prevent_disconnect == True:
+        removable = non_tree_edges(adj_triu)
+    else:
+        removable = edges.copy()
+    if verbose == True:
+        print(
+            "Removable edges (not needed for connectivity):",
+            len(removable),
+            "of",
+            len(edges),
+        )
+
+    np.random.shuffle(removable)
+    test_edges = removable[:num_test]
+    val_edges = removable[num_test : num_test + num_val]
+
+    if len(val_edges) < num_val or len(test_edges) < num_test:
+        print(
+            "WARNING: not enough removable edges to perform full train-test split!"
+        )
+        print(
+            "Num. (test, val) edges requested: (", num_test, ", ", num_val, ")"
+        )
+        print(
+            "Num. (test, val) edges returned: (",
+            len(test_edges),
+            ", ",
+            len(val_edges),
+            ")",
+        )
+
+    num_nodes = adj.shape[0]
+    held_out = np.isin(
+        edge_keys(edges, num_nodes),
+        edge_keys(np.concatenate([test_edges, val_edges]), num_nodes),
     )
-    val_edges = np.array([list(edge_tuple) for edge_tuple in val_edges])
-    val_edges_false = np.array(
-        [list(edge_tuple) for edge_tuple in val_edges_false]
+    train_edges = edges[~held_out]
+
+    (
+        train_edges_false,
+        val_edges_false,
+        test_edges_false,
+    ) = sample_false_edges(
+        num_nodes, edges, len(train_edges), num_val, num_test, verbose
     )
-    test_edges = np.array([list(edge_tuple) for edge_tuple in test_edges])
-    test_edges_false = np.array(
-        [list(edge_tuple) for edge_tuple in test_edges_false]
+
+    if verbose == True:
+        print("creating adj_train...")
+
+    # Re-build symmetric adj matrix from the remaining edges and weights
+    adj_train = sp.csr_matrix(
+        (adj_triu.data[~held_out], (train_edges[:, 0], train_edges[:, 1])),
+        shape=adj.shape,
     )
+    adj_train = adj_train + adj_train.T
+
+    if prevent_disconnect == True:
+        assert (
+            connected_components(adj_train, directed=False)[0]
+            == connected_components(adj, directed=False)[0]
+        )
 
     if verbose == True:
         print("Done with train-test split!")
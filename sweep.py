@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: sweep.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Hyperparameter sweep for node2vec link prediction. Every stage is cached
+    on disk by its inputs (with the same keys as predict_links.py): the
+    train-test split by seed and fractions, the alias tables by p/q, the
+    walks by p/q, length and count and the embeddings by all settings, so
+    each is computed once for the whole grid and reused by later runs.
+"""
+
+import itertools
+import multiprocessing
+import os
+
+import pandas as pd
+
+from typing import Any, Dict, List, Tuple
+
+from predict_links import (
+    CODE_FILES,
+    GRAPH_DIR,
+    evaluate,
+    load_network,
+    split_edges,
+    train_embeddings,
+)
+from src import node2vec
+from src.cache import ArtifactCache
+from src.graph_io import graph_files
+
+
+# Settings to sweep, every combination is evaluated
+GRID: Dict[str, List[Any]] = {
+    "p": [0.25, 1, 4],
+    "q": [0.25, 1, 4],
+    "window_size": [10],
+    "num_walks": [10],
+    "walk_length": [80],
+    "dimensions": [128],
+}
+
+SEED: int = 0
+TEST_FRAC: float = 0.3
+VAL_FRAC: float = 0.1
+DIRECTED: bool = False
+ITER: int = 1
+WORKERS: int = os.cpu_count() or 1
+
+# Edges into nodes of higher degree are sampled by rejection instead of
+# alias tables, which would take O(sum of squared degrees) memory
+MAX_TABLE_DEGREE: int = 50
+
+RESULTS_DIR: str = "combined_graph/results"
+RESULTS_FILE: str = "sweep.csv"
+
+
+def configurations(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """All combinations of the grid settings."""
+
+    return [
+        dict(zip(grid.keys(), values))
+        for values in itertools.product(*grid.values())
+    ]
+
+
+def split_key(cache: ArtifactCache) -> str:
+    """Key of the train-test split (as in predict_links.py)."""
+
+    return cache.key(
+        "split",
+        graph_files(GRAPH_DIR),
+        CODE_FILES,
+        seed=SEED,
+        test_frac=TEST_FRAC,
+        val_frac=VAL_FRAC,
+    )
+
+
+def run_group(configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Evaluate configurations that share p and q."""
+
+    cache = ArtifactCache()
+    key = split_key(cache)
+    split = cache.fetch(
+        key,
+        lambda: split_edges(load_network()[0], SEED, TEST_FRAC, VAL_FRAC),
+    )
+    adj_train = split[0]
+
+    p, q = configs[0]["p"], configs[0]["q"]
+
+    def preprocess() -> node2vec.Graph:
+        graph = node2vec.Graph.from_sparse(adj_train, DIRECTED, p, q)
+        graph.preprocess_transition_probs(
+            flat=True, max_table_degree=MAX_TABLE_DEGREE
+        )
+        return graph
+
+    alias_key = cache.key(
+        "alias",
+        code=CODE_FILES,
+        split=key,
+        p=p,
+        q=q,
+        directed=DIRECTED,
+        max_table_degree=MAX_TABLE_DEGREE,
+    )
+    graph = cache.fetch(alias_key, preprocess)
+
+    rows: List[Dict[str, Any]] = []
+    for config in configs:
+        num_walks, walk_length = config["num_walks"], config["walk_length"]
+
+        # NOTE: The walks do not depend on the number of workers, one is
+        #       used since pool workers cannot start processes of their own
+        walks_key = cache.key(
+            "walks",
+            code=CODE_FILES,
+            alias=alias_key,
+            num_walks=num_walks,
+            walk_length=walk_length,
+            seed=SEED,
+        )
+        walks_file = cache.fetch_path(
+            walks_key,
+            "walks.txt",
+            lambda path: graph.write_walks(
+                path,
+                num_walks,
+                walk_length,
+                verbose=False,
+                workers=1,
+                seed=SEED,
+            ),
+        )
+
+        emb_key = cache.key(
+            "embeddings",
+            code=CODE_FILES,
+            walks=walks_key,
+            dimensions=config["dimensions"],
+            window_size=config["window_size"],
+            iter=ITER,
+        )
+        emb_matrix = cache.fetch(
+            emb_key,
+            lambda: train_embeddings(
+                walks_file,
+                adj_train.shape[0],
+                config["dimensions"],
+                config["window_size"],
+                1,
+                ITER,
+            ),
+        )
+
+        for operator, score in evaluate(emb_matrix, split).items():
+            rows.append({**config, "operator": operator, **score})
+
+        print("Done:", config)
+
+    return rows
+
+
+def main() -> None:
+    """The main function. The sweep is run here."""
+
+    # Compute the split once, before the workers look it up
+    # NOTE: Loading the network first converts an old pickle, the split key
+    #       hashes the converted files
+    adj, _ = load_network()
+    cache = ArtifactCache()
+    cache.fetch(
+        split_key(cache), lambda: split_edges(adj, SEED, TEST_FRAC, VAL_FRAC)
+    )
+
+    # Group configurations by p/q so alias tables and walks are reused
+    groups: Dict[Tuple[float, float], List[Dict[str, Any]]] = {}
+    for config in configurations(GRID):
+        groups.setdefault((config["p"], config["q"]), []).append(config)
+
+    rows: List[Dict[str, Any]] = []
+    with multiprocessing.Pool(min(WORKERS, len(groups))) as pool:
+        for group_rows in pool.imap_unordered(run_group, groups.values()):
+            rows.extend(group_rows)
+
+    results = pd.DataFrame(rows).sort_values(list(GRID) + ["operator"])
+    results.to_csv(os.path.join(RESULTS_DIR, RESULTS_FILE), index=False)
+    print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
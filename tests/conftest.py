@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts import their siblings as top-level modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "visualization")]
@@ -0,0 +1,25 @@
+import numpy as np
+
+from embedding_store import read_emd, write_emd
+
+# As gensim's save_word2vec_format writes it (the repr of every float32)
+GENSIM_EMD = (
+    "3 4\n"
+    "pneumonia@Disease 0.1 -0.2 1.0 0.0\n"
+    "1 1e-05 -3.4028235e+38 123456.79 2.5e-08\n"
+    "crp 0.33333334 -0.6666667 7.0 -1e-45\n"
+)
+
+
+def test_write_emd_round_trips_gensim_format(tmp_path):
+    emd_file = tmp_path / "gensim.emd"
+    emd_file.write_text(GENSIM_EMD)
+
+    words, vectors = read_emd(str(emd_file))
+    assert words == ["pneumonia@Disease", "1", "crp"]
+    assert vectors.dtype == np.float32
+    assert vectors[0, 0] == np.float32(0.1)
+
+    out_file = tmp_path / "out.emd"
+    write_emd(str(out_file), words, vectors)
+    assert out_file.read_text() == GENSIM_EMD
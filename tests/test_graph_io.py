@@ -0,0 +1,91 @@
+import pickle
+
+import networkx as nx
+import numpy as np
+
+from src.graph_io import convert_pickle, load_graph
+
+
+def test_convert_pickle_keeps_networkx_node_order(tmp_path):
+    # Node ids first seen out of order, node 4 only in the features file
+    edges_path = tmp_path / "edges.csv"
+    edges_path.write_text("3,1\r\n1,2\r\n5,3\r\n")
+    feats_path = tmp_path / "features.csv"
+    feats_path.write_text(
+        "idx,source_idx,feature\r\n"
+        + "".join("{0},{0},{0}\r\n".format(idx) for idx in range(6))
+    )
+    nodes_path = tmp_path / "nodes.csv"
+    nodes_path.write_text(
+        "node\r\n" + "".join("n{}\r\n".format(i) for i in range(6))
+    )
+
+    # As the networkx version of generate_graph.py built the pickle
+    g = nx.read_edgelist(str(edges_path), delimiter=",", nodetype=int)
+    g.add_node(0)
+    for node in list(g.nodes()):
+        if node != 0:
+            g.add_edge(0, node)
+    for idx in range(6):
+        if not g.has_node(idx):
+            g.add_node(idx)
+            g.add_edge(idx, 0)
+        g.nodes[idx]["features"] = np.array([idx])
+    adj = nx.adjacency_matrix(g)
+    features = np.array([g.nodes[node]["features"] for node in g.nodes()])
+    assert list(g.nodes()) != sorted(g.nodes())
+
+    pickle_path = tmp_path / "adj_feat.pkl"
+    with open(pickle_path, "wb") as file:
+        pickle.dump((adj, features), file)
+
+    convert_pickle(
+        str(pickle_path),
+        str(tmp_path / "graph"),
+        str(edges_path),
+        str(feats_path),
+        str(nodes_path),
+    )
+    converted, converted_features, node_ids = load_graph(
+        str(tmp_path / "graph")
+    )
+
+    assert node_ids.tolist() == list(g.nodes())
+    assert converted_features[:, 0].tolist() == node_ids.tolist()
+    rows = {node: row for row, node in enumerate(node_ids)}
+    for u, v in g.edges():
+        assert converted[rows[u], rows[v]] == 1
+    assert converted.nnz == 2 * g.number_of_edges()
+
+
+def test_convert_pickle_keeps_sorted_node_order(tmp_path):
+    edges_path = tmp_path / "edges.csv"
+    edges_path.write_text("3,1\r\n1,2\r\n5,3\r\n")
+    feats_path = tmp_path / "features.csv"
+    feats_path.write_text(
+        "idx,source_idx,feature\r\n"
+        + "".join("{0},{0},{0}\r\n".format(idx) for idx in range(6))
+    )
+
+    # As the current generate_graph.py builds the pickle (sorted node ids)
+    g = nx.read_edgelist(str(edges_path), delimiter=",", nodetype=int)
+    g.add_nodes_from(range(6))
+    g.add_edges_from((0, node) for node in range(1, 6))
+    adj = nx.adjacency_matrix(g, nodelist=range(6))
+    features = np.arange(6).reshape(-1, 1)
+
+    pickle_path = tmp_path / "adj_feat.pkl"
+    with open(pickle_path, "wb") as file:
+        pickle.dump((adj, features), file)
+
+    convert_pickle(
+        str(pickle_path),
+        str(tmp_path / "graph"),
+        str(edges_path),
+        str(feats_path),
+        str(tmp_path / "nodes.csv"),
+    )
+    converted, _, node_ids = load_graph(str(tmp_path / "graph"))
+
+    assert node_ids.tolist() == list(range(6))
+    assert (converted != adj).nnz == 0
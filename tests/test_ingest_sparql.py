@@ -0,0 +1,120 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import generate_edges_features_data
+import ingest_sparql
+from ingest_sparql import ingest, iter_csv, iter_json, iter_tsv
+
+
+def test_iter_json_reads_bindings_split_across_blocks(monkeypatch):
+    monkeypatch.setattr(ingest_sparql, "BLOCK_SIZE", 7)
+    bindings = [
+        {
+            "text0": {"type": "literal", "value": "fever, high"},
+            "text1": {"type": "literal", "value": "D614G"},
+            "count": {"type": "literal", "value": str(count)},
+        }
+        for count in range(5)
+    ]
+    results = {"head": {"vars": ["text0", "text1", "count"]}}
+    results["results"] = {"bindings": bindings}
+
+    read = list(iter_json(io.StringIO(json.dumps(results, indent=1))))
+
+    assert read == [
+        {"text0": "fever, high", "text1": "D614G", "count": str(count)}
+        for count in range(5)
+    ]
+
+
+def test_iter_json_without_bindings():
+    assert list(iter_json(io.StringIO('{"head": {"vars": []}}'))) == []
+
+
+def test_iter_csv():
+    stream = io.StringIO('text0,text1,count\r\n"a, b",c,3\r\n')
+
+    assert list(iter_csv(stream)) == [
+        {"text0": "a, b", "text1": "c", "count": "3"}
+    ]
+
+
+def test_iter_tsv_decodes_terms():
+    stream = io.StringIO(
+        "?text0\t?text1\t?count\r\n"
+        '"tab\\there"@en\t<http://x/y>\t'
+        '"3"^^<http://www.w3.org/2001/XMLSchema#int>\r\n'
+        '"no count"\t"b"\t\r\n'
+    )
+
+    assert list(iter_tsv(stream)) == [
+        {"text0": "tab\there", "text1": "http://x/y", "count": "3"},
+        {"text0": "no count", "text1": "b"},
+    ]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_sparql, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        generate_edges_features_data, "DATA_DIR", str(tmp_path)
+    )
+    return tmp_path
+
+
+def test_ingest_skips_repeated_edges_and_keeps_counts(data_dir):
+    results = data_dir / "results.csv"
+    results.write_text(
+        "text0,type0,text1,type1,count\r\n"
+        "a,X,b,Y,5\r\n"
+        "b,Y,c,X,3\r\n"
+        "b,Y,a,X,2\r\n"  # a-b again, reversed
+        ",X,c,X,4\r\n"  # no text
+        "c,X,d,Y,\r\n"  # no count
+    )
+
+    assert ingest(str(results)) == (5, 4, 3)
+
+    data = pd.read_csv(data_dir / "data.csv")
+    assert data.values.tolist() == [
+        ["a@X", "b@Y", 5],
+        ["b@Y", "c@X", 3],
+        ["c@X", "d@Y", 1],
+    ]
+    nodes = pd.read_csv(data_dir / "nodes.csv")["node"].tolist()
+    assert nodes == ["a@X", "b@Y", "c@X", "d@Y"]
+    edges = pd.read_csv(data_dir / "edges.csv", header=None)
+    assert edges.values.tolist() == [[0, 1, 5], [1, 2, 3], [2, 3, 1]]
+    features = pd.read_csv(data_dir / "features.csv")
+    assert features["idx"].tolist() == [0, 1, 2, 3]
+
+
+def test_ingest_keeps_files_when_source_fails(data_dir):
+    for filename in ("data.csv", "edges.csv", "features.csv", "nodes.csv"):
+        (data_dir / filename).write_text("old\r\n")
+
+    with pytest.raises(ValueError):
+        ingest(str(data_dir / "results.xml"))
+
+    broken = data_dir / "results.json"
+    broken.write_text('{"results": {"bindings": [{"text0": {"value": "a"')
+    with pytest.raises(ValueError):
+        ingest(str(broken))
+
+    for filename in ("data.csv", "edges.csv", "features.csv", "nodes.csv"):
+        assert (data_dir / filename).read_text() == "old\r\n"
+    assert not list(data_dir.glob("*.tmp"))
+
+
+def test_build_keeps_counts_as_edge_weights(data_dir):
+    (data_dir / "data.csv").write_text(
+        "node_1,node_2,count\r\na,b,5\r\nb,c,3\r\n"
+    )
+
+    generate_edges_features_data.build()
+
+    edges = pd.read_csv(data_dir / "edges.csv", header=None)
+    assert edges.values.tolist() == [[0, 1, 5], [1, 2, 3]]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from src import node2vec
+
+P = 0.5
+Q = 2.0
+
+
+def toy_adj(edges, num_nodes):
+    """Symmetric weighted adjacency matrix of (u, v, weight) edges."""
+    rows, cols, weights = zip(*edges)
+    adj = sp.coo_matrix((weights, (rows, cols)), shape=(num_nodes, num_nodes))
+    return (adj + adj.T).tocsr()
+
+
+# Triangle 0-1-2, hub 3 and a pendant node 4, with different weights
+ADJ = toy_adj(
+    [(0, 1, 1), (0, 2, 2), (1, 2, 1), (2, 3, 3), (3, 4, 1), (1, 3, 1)], 5
+)
+
+
+def expected_transitions(adj, p, q):
+    """Exact node2vec transition probabilities of every (prev, cur) pair."""
+    adj = adj.toarray()
+    probs = {}
+    for prev, cur in zip(*np.nonzero(adj)):
+        bias = np.where(adj[prev] > 0, 1.0, 1.0 / q)
+        bias[prev] = 1.0 / p
+        weights = adj[cur] * bias
+        probs[prev, cur] = weights / weights.sum()
+    return probs
+
+
+def observed_transitions(walks, num_nodes):
+    """Empirical transition frequencies of every (prev, cur) pair."""
+    counts = np.zeros((num_nodes, num_nodes, num_nodes))
+    triples = np.stack([walks[:, :-2], walks[:, 1:-1], walks[:, 2:]], axis=2)
+    triples = triples.reshape(-1, 3)
+    np.add.at(counts, tuple(triples.T), 1)
+    totals = counts.sum(axis=2, keepdims=True)
+    return counts / np.maximum(totals, 1), totals[..., 0]
+
+
+@pytest.mark.parametrize("max_table_degree", [None, 2, 0])
+def test_csr_walks_follow_node2vec_transitions(max_table_degree):
+    # None builds every edge table, 0 samples every step by rejection and
+    # 2 mixes both (the edges into nodes 1, 2 and 3 have no tables)
+    graph = node2vec.Graph.from_sparse(ADJ, False, P, Q)
+    graph.preprocess_transition_probs(
+        flat=True, max_table_degree=max_table_degree
+    )
+
+    walks = graph.walk_matrix(2000, 12, verbose=False, seed=0)
+    assert (walks >= 0).all()
+
+    observed, totals = observed_transitions(walks, 5)
+    for (prev, cur), probs in expected_transitions(ADJ, P, Q).items():
+        assert totals[prev, cur] > 1000
+        np.testing.assert_allclose(observed[prev, cur], probs, atol=0.03)
+
+
+@pytest.mark.parametrize("max_table_degree", [None, 0])
+def test_walks_do_not_depend_on_workers(max_table_degree):
+    graph = node2vec.Graph.from_sparse(ADJ, False, P, Q)
+    graph.preprocess_transition_probs(
+        flat=True, max_table_degree=max_table_degree
+    )
+
+    single = graph.walk_matrix(3, 10, verbose=False, workers=1, seed=7)
+    pooled = graph.walk_matrix(3, 10, verbose=False, workers=2, seed=7)
+    other = graph.walk_matrix(3, 10, verbose=False, workers=1, seed=8)
+
+    np.testing.assert_array_equal(single, pooled)
+    assert not np.array_equal(single, other)
+
+
+def test_update_matches_rebuild():
+    graph = node2vec.Graph.from_sparse(ADJ, False, P, Q)
+    graph.preprocess_transition_probs(flat=True, max_table_degree=2)
+
+    # Reweight 0-2, add the edge 0-4 and a new node 5 connected to 4
+    new_adj = ADJ.tolil()
+    new_adj.resize((6, 6))
+    for u, v, weight in [(0, 2, 5), (0, 4, 1), (4, 5, 2)]:
+        new_adj[u, v] = new_adj[v, u] = weight
+    new_adj = new_adj.tocsr()
+
+    affected = graph.update(new_adj)
+
+    rebuilt = node2vec.Graph.from_sparse(new_adj, False, P, Q)
+    rebuilt.preprocess_transition_probs(flat=True, max_table_degree=2)
+
+    assert affected.tolist() == [0, 2, 4, 5]
+    arrays = graph.csr_arrays()
+    for name, array in rebuilt.csr_arrays().items():
+        np.testing.assert_array_equal(arrays[name], array, err_msg=name)
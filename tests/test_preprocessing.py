@@ -0,0 +1,53 @@
+import numpy as np
+import scipy.sparse as sp
+
+from scipy.sparse.csgraph import connected_components
+
+from src.preprocessing import edge_keys, mask_test_edges_sparse
+
+
+def test_mask_test_edges_sparse_keeps_train_graph_connected(capsys):
+    # Random connected graph: a path through all nodes plus random chords
+    rng = np.random.RandomState(0)
+    num_nodes = 200
+    rows = np.concatenate([np.arange(num_nodes - 1), rng.randint(0, 200, 600)])
+    cols = np.concatenate([np.arange(1, num_nodes), rng.randint(0, 200, 600)])
+    adj = sp.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(num_nodes, num_nodes)
+    )
+    adj = ((adj + adj.T) > 0).astype(np.float64)
+
+    np.random.seed(0)
+    (
+        adj_train,
+        train_edges,
+        train_edges_false,
+        val_edges,
+        val_edges_false,
+        test_edges,
+        test_edges_false,
+    ) = mask_test_edges_sparse(adj, test_frac=0.3, val_frac=0.1)
+
+    # Nothing is printed unless verbose
+    assert capsys.readouterr().out == ""
+
+    assert connected_components(adj_train, directed=False)[0] == 1
+    assert (adj_train != adj_train.T).nnz == 0
+
+    # Held-out edges are removed from the train graph
+    for edges in (val_edges, test_edges):
+        assert len(edges) > 0
+        assert not np.asarray(adj_train[edges[:, 0], edges[:, 1]]).any()
+    assert np.asarray(adj[train_edges[:, 0], train_edges[:, 1]]).all()
+
+    # False edges miss adj and do not overlap
+    false_keys = []
+    for edges in (train_edges_false, val_edges_false, test_edges_false):
+        assert np.all(edges[:, 0] < edges[:, 1])
+        assert not np.asarray(adj[edges[:, 0], edges[:, 1]]).any()
+        false_keys.append(edge_keys(edges, num_nodes))
+    false_keys = np.concatenate(false_keys)
+    assert len(np.unique(false_keys)) == len(false_keys)
+    assert len(train_edges_false) == len(train_edges)
+    assert len(val_edges_false) == len(val_edges)
+    assert len(test_edges_false) == len(test_edges)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from similarity_index import SimilarityIndex
+
+
+def test_top_k_among_candidates_of_another_type():
+    vectors = np.array(
+        [[1, 0], [0.9, 0.1], [0.5, 0.5], [0, 1]], dtype=np.float32
+    )
+    index = SimilarityIndex(["a", "b", "c", "d"], vectors)
+
+    # Query rows outside the candidates keep k results
+    indices, _ = index.top_k(np.array([0]), k=2, candidates=np.array([2, 3]))
+    assert indices.tolist() == [[2, 3]]
+    indices, _ = index.top_k(np.array([0]), k=2, candidates=np.array([3]))
+    assert indices.tolist() == [[3]]
+
+    # The row itself is never a neighbor
+    indices, _ = index.top_k(np.array([2]), k=2, candidates=np.array([2, 3]))
+    assert indices.tolist() == [[3]]
+    results = index.most_similar_batch(
+        ["a", "c"], topn=2, candidates=np.array([2, 3])
+    )
+    assert [[word for word, _ in result] for result in results] == [
+        ["c", "d"],
+        ["d"],
+    ]
@@ -0,0 +1,63 @@
+import pickle
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import update_graph
+from src.graph_io import convert_pickle, load_graph
+
+
+def test_update_network_on_converted_graph(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "pickle").mkdir()
+
+    # Node ids first seen out of order, so the converted rows are unsorted
+    edges_path = tmp_path / "data" / "edges.csv"
+    edges_path.write_text("3,1\r\n1,2\r\n5,3\r\n4,2\r\n")
+    feats_path = tmp_path / "data" / "features.csv"
+    feats_path.write_text(
+        "idx,source_idx,feature\r\n"
+        + "".join("{0},{0},0\r\n".format(idx) for idx in range(6))
+    )
+
+    # As the networkx version of generate_graph.py built the pickle
+    g = nx.read_edgelist(str(edges_path), delimiter=",", nodetype=int)
+    g.add_node(0)
+    for node in list(g.nodes()):
+        if node != 0:
+            g.add_edge(0, node)
+    adj = nx.adjacency_matrix(g)
+    features = np.array([[node, 0] for node in g.nodes()], dtype=np.float64)
+    with open(tmp_path / "pickle" / "adj_feat.pkl", "wb") as file:
+        pickle.dump((adj, features), file)
+
+    convert_pickle(
+        "pickle/adj_feat.pkl",
+        "graph",
+        str(edges_path),
+        str(feats_path),
+        str(tmp_path / "missing.csv"),
+    )
+    old_ids = load_graph("graph")[2].tolist()
+    assert old_ids != sorted(old_ids)
+
+    # Edges between known nodes and to the new node 6
+    new_features = pd.DataFrame(
+        {"source_idx": [6], "feature": [0]}, index=pd.Index([6], name="idx")
+    )
+    updated = update_graph.update_network(
+        np.array([1, 5]), np.array([6, 4]), new_features
+    )
+
+    _, updated_features, node_ids = load_graph("graph")
+    assert node_ids.tolist() == old_ids + [6]
+    assert updated_features[:, 0].tolist() == node_ids.tolist()
+
+    rows = {node: row for row, node in enumerate(node_ids)}
+    expected = set(g.edges()) | {(1, 6), (5, 4), (0, 6)}
+    assert updated.nnz == 2 * len(expected)
+    for u, v in expected:
+        assert updated[rows[u], rows[v]] == 1
+        assert updated[rows[v], rows[u]] == 1
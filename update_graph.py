@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: update_graph.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Add new co-occurrence rows to the network without a full rebuild.
+
+    The new rows (a CSV file with node_1 and node_2 columns and, as a
+    data.csv written by ingest_sparql.py, an optional count column) whose
+    edges are not in data.csv yet are appended to data.csv,
+    edges.csv, features.csv and nodes.csv, new labels get the next free
+    node indices and the stored graph gets the new edges. Only the alias
+    tables of the affected nodes are rebuilt, walks are simulated from the
+    affected nodes only and the Word2Vec model is trained further on them.
+
+    The first run trains the model on the whole graph. Rerunning the
+    generate_*.py scripts re-encodes all nodes, so remove MODEL_DIR
+    afterwards to start over.
+
+Usage:
+    python update_graph.py new_rows.csv
+"""
+
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from typing import Optional, Tuple
+
+from generate_edges_features_data import (
+    DATA_DIR,
+    DATA_FILE,
+    EDGES_DATA,
+    FEATS_DATA,
+    NODES_DATA,
+    encode_nodes,
+)
+from generate_graph import GRAPH_DIR, adjacency, save
+from src import node2vec
+from src.graph_io import load_graph
+
+MODEL_DIR: str = "model"
+GRAPH_FILE: str = "node2vec.pkl"
+MODEL_FILE: str = "word2vec.model"
+WALKS_FILE: str = "walks.txt"
+
+# node2vec settings (as in predict_links.py)
+P: float = 1  # Return hyperparameter
+Q: float = 1  # In-out hyperparameter
+MAX_TABLE_DEGREE: int = 50  # Larger nodes are sampled by rejection (p != q)
+WINDOW_SIZE: int = 10  # Context size for optimization
+NUM_WALKS: int = 10  # Number of walks per source
+WALK_LENGTH: int = 80  # Length of walk per source
+DIMENSIONS: int = 128  # Embedding dimension
+WORKERS: int = 8  # Num. parallel workers
+ITER: int = 1  # SGD epochs
+
+
+def new_rows(rows: pd.DataFrame, data: pd.DataFrame) -> pd.DataFrame:
+    """The rows whose edge (in either direction) is not in data yet, each
+    edge once."""
+
+    def edge_keys(df: pd.DataFrame) -> pd.MultiIndex:
+        swap = df["node_1"] > df["node_2"]
+        return pd.MultiIndex.from_arrays(
+            [
+                df["node_1"].where(~swap, df["node_2"]),
+                df["node_2"].where(~swap, df["node_1"]),
+            ]
+        )
+
+    keys = edge_keys(rows)
+    new = ~keys.isin(edge_keys(data)) & ~keys.duplicated()
+
+    return rows[new].reset_index(drop=True)
+
+
+def extend_encoding(
+    labels: pd.Index, rows: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+    """Encode the nodes of new rows. Known labels keep their index and new
+    labels get the next indices in the order they are first seen. Returns
+    the node codes, the parent codes and the new labels."""
+
+    (node_codes, parent_codes), seen = encode_nodes(
+        rows["node_1"], rows["node_2"]
+    )
+
+    codes = labels.get_indexer(seen)
+    new = codes < 0
+    codes[new] = len(labels) + np.arange(new.sum())
+
+    return codes[node_codes], codes[parent_codes], seen[new]
+
+
+def append_data(
+    rows: pd.DataFrame,
+    node_codes: np.ndarray,
+    parent_codes: np.ndarray,
+    new_labels: pd.Index,
+    num_nodes: int,
+    weights: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Append the new rows to the data, edges, features and nodes files.
+    With weights (for weighted files) the data and edges rows get them as
+    their count column. Returns the features of the new nodes."""
+
+    def append(df: pd.DataFrame, filename: str) -> None:
+        df.to_csv(
+            os.path.join(DATA_DIR, filename),
+            mode="a",
+            header=False,
+            index=False,
+            line_terminator="\r\n",
+        )
+
+    idx = num_nodes + np.arange(len(new_labels))
+    edges = pd.DataFrame(
+        {"source_idx": node_codes, "target_idx": parent_codes}
+    )
+    features = pd.DataFrame({"idx": idx, "source_idx": idx, "feature": 0})
+    data = rows[["node_1", "node_2"]]
+    if weights is not None:
+        data = data.assign(count=weights)
+        edges["count"] = weights
+
+    append(data, DATA_FILE)
+    append(edges, EDGES_DATA)
+    append(features, FEATS_DATA)
+    append(pd.DataFrame({"node": new_labels}), NODES_DATA)
+
+    return features.set_index("idx")
+
+
+def update_network(
+    node_codes: np.ndarray,
+    parent_codes: np.ndarray,
+    features: pd.DataFrame,
+    weights: Optional[np.ndarray] = None,
+) -> sp.csr_matrix:
+    """Add the new edges (of weight 1 by default) and nodes to the stored
+    graph. Returns the new adjacency matrix."""
+
+    # NOTE: The files are rewritten below, so they are not memory-mapped
+    adj, old_features, node_ids = load_graph(GRAPH_DIR, mmap_mode=None)
+
+    node_ids = np.concatenate([node_ids, features.index.to_numpy()])
+    num_nodes = len(node_ids)
+
+    # Row of every node id (a graph converted from a legacy pickle is not
+    # in sorted id order)
+    lookup = np.full(node_ids.max() + 1, -1, dtype=np.int64)
+    lookup[node_ids] = np.arange(num_nodes)
+    rows = lookup[node_codes]
+    cols = lookup[parent_codes]
+
+    # The root is directly connected to the new nodes as well
+    root = lookup[0]
+    added = np.arange(adj.shape[0], num_nodes)
+    if weights is None:
+        weights = np.ones(len(rows), dtype=np.int64)
+    delta = adjacency(rows, cols, weights, num_nodes, root, added)
+
+    adj = adj.tocsr()
+    adj.resize((num_nodes, num_nodes))
+    adj = adj.maximum(delta).astype(adj.dtype)
+
+    features = np.concatenate(
+        [old_features, features.to_numpy(dtype=np.float64)]
+    )
+    save(adj, features, node_ids)
+
+    return adj
+
+
+def train(g_n2v: node2vec.Graph, starts: Optional[np.ndarray] = None) -> None:
+    """Simulate walks (from starts, by default every node) and train the
+    stored Word2Vec model on them, creating it on the first run. Nothing
+    is done for an empty starts."""
+
+    # NOTE: gensim is only needed for training
+    from gensim.models import Word2Vec
+
+    if starts is not None and len(starts) == 0:
+        return
+
+    walks_file = os.path.join(MODEL_DIR, WALKS_FILE)
+    g_n2v.write_walks(
+        walks_file, NUM_WALKS, WALK_LENGTH, workers=WORKERS, starts=starts
+    )
+
+    model_file = os.path.join(MODEL_DIR, MODEL_FILE)
+    if starts is None:
+        model = Word2Vec(
+            corpus_file=walks_file,
+            size=DIMENSIONS,
+            window=WINDOW_SIZE,
+            min_count=0,
+            sg=1,
+            workers=WORKERS,
+            iter=ITER,
+        )
+    else:
+        model = Word2Vec.load(model_file)
+        model.build_vocab(corpus_file=walks_file, update=True)
+        model.train(
+            corpus_file=walks_file,
+            total_words=model.corpus_total_words,
+            epochs=model.epochs,
+        )
+
+    model.save(model_file)
+    os.remove(walks_file)
+
+
+def main() -> None:
+    """The main function. The update is done here."""
+
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python update_graph.py new_rows.csv")
+
+    # Rows already in data.csv are skipped
+    data = pd.read_csv(os.path.join(DATA_DIR, DATA_FILE))
+    rows = new_rows(pd.read_csv(sys.argv[1]), data)
+    if len(rows) == 0:
+        print("No new rows")
+        return
+
+    labels = pd.Index(pd.read_csv(os.path.join(DATA_DIR, NODES_DATA))["node"])
+
+    # Files written by ingest_sparql.py are weighted by the row counts, new
+    # rows without a count get weight 1
+    weights = None
+    if "count" in data.columns:
+        weights = (
+            rows.get("count", pd.Series(1, index=rows.index))
+            .fillna(1)
+            .to_numpy(dtype=np.int64)
+        )
+
+    node_codes, parent_codes, new_labels = extend_encoding(labels, rows)
+    features = append_data(
+        rows, node_codes, parent_codes, new_labels, len(labels), weights
+    )
+    adj = update_network(node_codes, parent_codes, features, weights)
+
+    print("New rows:", len(rows))
+    print("New nodes:", len(new_labels))
+    print("Total nodes:", adj.shape[0])
+
+    # Rebuild the alias tables and retrain only around the affected nodes
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    graph_file = os.path.join(MODEL_DIR, GRAPH_FILE)
+    if os.path.exists(graph_file):
+        with open(graph_file, "rb") as f:
+            g_n2v = pickle.load(f)
+        affected = g_n2v.update(adj)
+        print("Affected nodes:", len(affected))
+        train(g_n2v, affected)
+    else:
+        g_n2v = node2vec.Graph.from_sparse(adj, False, P, Q)
+        g_n2v.preprocess_transition_probs(
+            flat=True, max_table_degree=MAX_TABLE_DEGREE, verbose=True
+        )
+        train(g_n2v)
+
+    with open(graph_file, "wb") as f:
+        pickle.dump(g_n2v, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+if __name__ == "__main__":
+    main()
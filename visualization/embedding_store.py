@@ -0,0 +1,213 @@
+"""
+Filename: embedding_store.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Binary storage of node embeddings.
+
+    The word2vec text format (.emd) has to be parsed float by float on every
+    load. The binary store keeps the vocabulary and the vectors next to the
+    .emd file, and the vectors are opened memory-mapped, so loading is close
+    to instant and processes share the same pages:
+
+        <embedding file>.vocab.txt        the word of every row
+        <embedding file>.float32.npy      vectors
+        <embedding file>.float16.npy      half-precision vectors (optional)
+        <embedding file>.int8.npy         int8-quantized vectors (optional)
+        <embedding file>.int8.scale.npy   float32 scale of every int8 row
+
+    Quantized rows are dequantized only when they are read, the int8
+    variant stores every row as round(row / scale) with
+    scale = max(abs(row)) / 127.
+
+Usage (export a .emd file or write one back from the binary store):
+    python embedding_store.py export file.emd [float16] [int8]
+    python embedding_store.py import file.emd
+"""
+
+import csv
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Optional, Sequence, Tuple
+
+VARIANTS: Tuple[str, ...] = ("float32", "float16", "int8")
+
+
+def read_emd(emb_file: str) -> Tuple[List[str], np.ndarray]:
+    """Read the words and float32 vectors of a word2vec text file."""
+
+    with open(emb_file) as file:
+        num_words, dimensions = (int(size) for size in file.readline().split())
+
+    df = pd.read_csv(
+        emb_file,
+        sep=" ",
+        header=None,
+        skiprows=1,
+        quoting=csv.QUOTE_NONE,
+        dtype={0: str},
+        keep_default_na=False,
+    )
+    vectors = df.iloc[:, 1 : dimensions + 1].to_numpy(dtype=np.float32)
+    assert vectors.shape == (num_words, dimensions)
+
+    return df[0].tolist(), vectors
+
+
+def write_emd(
+    emb_file: str, words: Sequence[str], vectors: np.ndarray
+) -> None:
+    """Write words and vectors as a word2vec text file. Every float32
+    value is written in its shortest form that reads back as the same
+    float32, as gensim writes it, so read_emd gives back the same
+    vectors."""
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with open(emb_file, "w") as file:
+        file.write("{} {}\n".format(*vectors.shape))
+        for word, vector in zip(words, vectors):
+            file.write(word + " " + " ".join(map(str, vector)))
+            file.write("\n")
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 rows and float32 per-row scales of vectors."""
+
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    data = np.rint(vectors / scales[:, None]).astype(np.int8)
+
+    return data, scales.astype(np.float32)
+
+
+class EmbeddingStore:
+    """Memory-mapped embeddings of one variant of the binary store."""
+
+    def __init__(
+        self,
+        words: List[str],
+        data: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+    ) -> None:
+        self.words = words
+        self.data = data
+        self.scales = scales
+        self.rows = {word: row for row, word in enumerate(words)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def vectors(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """float32 vectors of rows (default all rows)."""
+
+        if rows is None:
+            rows = slice(None)
+        vectors = np.asarray(self.data[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows, None]
+
+        return vectors
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        """float32 vector of word."""
+
+        return self.vectors(np.array([self.rows[word]]))[0]
+
+
+def variant_files(emb_file: str, variant: str) -> List[str]:
+    """Files of variant in the binary store of emb_file."""
+
+    files = [emb_file + "." + variant + ".npy"]
+    if variant == "int8":
+        files.append(emb_file + ".int8.scale.npy")
+
+    return files
+
+
+def save_store(
+    emb_file: str,
+    words: Sequence[str],
+    vectors: np.ndarray,
+    variants: Sequence[str] = ("float32",),
+) -> None:
+    """Store words and vectors (and the other variants) next to emb_file."""
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with open(emb_file + ".vocab.txt", "w") as file:
+        for word in words:
+            file.write(word + "\n")
+
+    for variant in variants:
+        if variant == "int8":
+            arrays = quantize(vectors)
+        elif variant in VARIANTS:
+            arrays = (vectors.astype(variant),)
+        else:
+            raise ValueError(
+                "unknown variant {!r}, expected one of {}".format(
+                    variant, ", ".join(VARIANTS)
+                )
+            )
+        for path, array in zip(variant_files(emb_file, variant), arrays):
+            # Replace, not overwrite, files other processes may have mapped
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, array)
+            os.replace(path + ".tmp", path)
+
+
+def is_stale(emb_file: str, variant: str = "float32") -> bool:
+    """Whether variant is missing from the store or older than emb_file."""
+
+    paths = variant_files(emb_file, variant) + [emb_file + ".vocab.txt"]
+    if not all(os.path.exists(path) for path in paths):
+        return True
+    if not os.path.exists(emb_file):
+        return False
+
+    return min(os.path.getmtime(path) for path in paths) < os.path.getmtime(
+        emb_file
+    )
+
+
+def load_store(
+    emb_file: str, variant: str = "float32", mmap_mode: Optional[str] = "r"
+) -> EmbeddingStore:
+    """Open variant of the binary store of emb_file. The store is
+    (re)exported first when it is missing or older than emb_file."""
+
+    if is_stale(emb_file, variant):
+        words, vectors = read_emd(emb_file)
+        variants = {"float32", variant}
+        save_store(emb_file, words, vectors, sorted(variants))
+
+    with open(emb_file + ".vocab.txt") as file:
+        words = file.read().split("\n")[:-1]
+    arrays = [
+        np.load(path, mmap_mode=mmap_mode)
+        for path in variant_files(emb_file, variant)
+    ]
+
+    return EmbeddingStore(words, *arrays)
+
+
+def main() -> None:
+    """The main function."""
+
+    command, emb_file = sys.argv[1], sys.argv[2]
+    if command == "export":
+        words, vectors = read_emd(emb_file)
+        save_store(emb_file, words, vectors, ["float32"] + sys.argv[3:])
+    elif command == "import":
+        store = load_store(emb_file)
+        write_emd(emb_file, store.words, store.vectors())
+    else:
+        sys.exit(__doc__)
+
+
+if __name__ == "__main__":
+    main()
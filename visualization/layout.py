@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: layout.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    2D layout and clustering of the node embeddings.
+
+    The embeddings are reduced with PCA, laid out in 2D with t-SNE and
+    clustered with mini-batch k-means, then the coordinates and clusters
+    read by plot_interactive.py are written in their name;x;y and
+    name;cluster formats. t-SNE uses the FFT-accelerated openTSNE when it
+    is installed and the Barnes-Hut t-SNE of scikit-learn otherwise, both
+    on all cores.
+
+Usage:
+    python layout.py [clusters]
+"""
+
+import csv
+import sys
+import time
+
+import numpy as np
+
+from typing import List, Tuple
+
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+
+from embedding_store import load_store
+from similarity import EMB_FILE
+
+try:
+    import openTSNE
+except ImportError:
+    openTSNE = None
+
+COORDS_FILE: str = "../combined_graph/clusters/node_coordination.txt"
+CLUSTERS_FILE: str = "../combined_graph/clusters/node_clusters.txt"
+DICT_FILE: str = "../combined_graph/Combined_Dict.txt"
+
+PCA_DIMENSIONS: int = 50  # Dimensions kept before t-SNE and k-means
+PERPLEXITY: float = 30  # t-SNE perplexity
+NUM_CLUSTERS: int = 37  # Number of k-means clusters
+BATCH_SIZE: int = 1024  # Mini-batch size of k-means
+JOBS: int = -1  # Num. parallel jobs (-1 is all cores)
+SEED: int = 0  # Random seed
+
+
+def load_embeddings() -> Tuple[List[str], np.ndarray]:
+    """Names (as in Combined_Dict.txt) and embeddings of the nodes."""
+
+    names = {}
+    with open(DICT_FILE) as file:
+        for row in csv.reader(file, delimiter=";"):
+            names[row[1]] = row[0]
+
+    store = load_store(EMB_FILE)
+    rows = [row for row, word in enumerate(store.words) if word in names]
+
+    return (
+        [names[store.words[row]] for row in rows],
+        store.vectors(np.array(rows, dtype=np.int64)),
+    )
+
+
+def reduce(vectors: np.ndarray) -> np.ndarray:
+    """PCA pre-reduction of the embeddings."""
+
+    dimensions = min(PCA_DIMENSIONS, *vectors.shape)
+
+    return PCA(n_components=dimensions, random_state=SEED).fit_transform(
+        vectors
+    )
+
+
+def embed_2d(reduced: np.ndarray) -> np.ndarray:
+    """t-SNE layout of the reduced embeddings."""
+
+    if openTSNE is not None:
+        tsne = openTSNE.TSNE(
+            perplexity=PERPLEXITY,
+            negative_gradient_method="fft",
+            n_jobs=JOBS,
+            random_state=SEED,
+        )
+        return np.asarray(tsne.fit(reduced))
+
+    tsne = TSNE(
+        perplexity=PERPLEXITY,
+        learning_rate=200.0,
+        init="pca",
+        method="barnes_hut",
+        n_jobs=JOBS,
+        random_state=SEED,
+    )
+    return tsne.fit_transform(reduced)
+
+
+def cluster(reduced: np.ndarray, num_clusters: int) -> np.ndarray:
+    """Mini-batch k-means clusters of the reduced embeddings."""
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=num_clusters,
+        batch_size=BATCH_SIZE,
+        n_init=3,
+        random_state=SEED,
+    )
+
+    return kmeans.fit_predict(reduced)
+
+
+def main() -> None:
+    """The main function."""
+
+    num_clusters = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_CLUSTERS
+
+    start = time.perf_counter()
+    names, vectors = load_embeddings()
+    print("Nodes:", len(names))
+
+    reduced = reduce(vectors)
+    labels = cluster(reduced, num_clusters)
+    print("Clustered in {:.1f} s".format(time.perf_counter() - start))
+
+    coords = embed_2d(reduced)
+    print("Laid out in {:.1f} s".format(time.perf_counter() - start))
+
+    # Quoted like csv.reader (and plot_interactive.py) parses them
+    with open(COORDS_FILE, "w", newline="") as file:
+        writer = csv.writer(file, delimiter=";", lineterminator="\n")
+        for name, (x, y) in zip(names, coords.astype(np.float32)):
+            writer.writerow([name, str(x), str(y)])
+    with open(CLUSTERS_FILE, "w", newline="") as file:
+        writer = csv.writer(file, delimiter=";", lineterminator="\n")
+        writer.writerows(zip(names, labels.tolist()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: load_test.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Measure the latency and throughput of similarity_service.py.
+
+    Several keep-alive connections send /similar queries for random
+    entities of Combined_Dict.txt (a fraction of them type-filtered) as fast
+    as the service answers, then the throughput and latency percentiles
+    are printed.
+
+Usage:
+    python load_test.py [port] [requests] [connections]
+"""
+
+import asyncio
+import csv
+import random
+import sys
+import time
+
+import numpy as np
+
+from typing import List
+from urllib.parse import urlencode
+
+from similarity_service import DICT_FILE, HOST, PORT
+
+REQUESTS: int = 10000
+CONNECTIONS: int = 16
+TYPES: List[str] = ["Gene", "Disease", "Chemical"]
+TYPED_FRACTION: float = 0.25
+
+
+async def client(
+    port: int, targets: List[str], latencies: List[float]
+) -> None:
+    """Send the requests of one connection one after the other."""
+
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        for target in targets:
+            start = time.perf_counter()
+            writer.write(
+                "GET {} HTTP/1.1\r\nHost: {}\r\n\r\n".format(
+                    target, HOST
+                ).encode()
+            )
+            await writer.drain()
+
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                key, _, value = line.decode().partition(":")
+                if key.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(port: int, num_requests: int, connections: int) -> None:
+    """Run the load test and print the results."""
+
+    with open(DICT_FILE) as file:
+        names = [row[0] for row in csv.reader(file, delimiter=";")]
+
+    targets = []
+    for _ in range(num_requests):
+        params = {"name": random.choice(names)}
+        if random.random() < TYPED_FRACTION:
+            params["type"] = random.choice(TYPES)
+        targets.append("/similar?" + urlencode(params))
+
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(port, targets[idx::connections], latencies)
+            for idx in range(connections)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    millis = np.array(latencies) * 1000
+    print("Requests:", len(latencies))
+    print("Connections:", connections)
+    print("Throughput: {:.0f} requests/s".format(len(latencies) / elapsed))
+    for percentile in (50, 95, 99):
+        print(
+            "Latency p{}: {:.2f} ms".format(
+                percentile, np.percentile(millis, percentile)
+            )
+        )
+
+
+def main() -> None:
+    """The main function."""
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else CONNECTIONS
+    asyncio.run(run(port, num_requests, connections))
+
+
+if __name__ == "__main__":
+    main()
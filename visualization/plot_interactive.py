@@ -9,19 +9,43 @@ E-mail:   oniani.david@mayo.edu
 Description:
     The program does co-occurence graph visualization using Bokeh.
     Besides, it does code-generation and creates a web search tool.
+
+    The inputs are parsed with pandas and joined on the node name, the top
+    10 of every node comes from the precomputed similarity table and the
+    search page is rendered in one pass. Nothing is regenerated when the
+    inputs did not change since the last run.
+
+    The export mode writes a search page that does not embed the data: a
+    names file and small binary neighbor shards, fetched by the page only
+    when an entity is selected (see export_search). The page has to be
+    served over HTTP, e.g. with python -m http.server in the directory.
+
+    The webgl mode saves the scatter plot drawn with WebGL from a slim
+    source, and the density mode also aggregates the nodes into a density
+    raster until zoomed in (see build_fast_plot). Both save graph.html.
+
+Usage:
+    python plot_interactive.py [export | webgl | density]
 """
 
-import csv
+import hashlib
+import json
+import os
+import sys
 
+import numpy as np
 import pandas as pd
 
-from typing import Dict, List
+from typing import Any, List, Tuple
 
-from bokeh.io import output_file, show
+from bokeh.io import output_file, save, show
 from bokeh.models import (
     BoxZoomTool,
     ColumnDataSource,
+    CustomJS,
+    CustomJSHover,
     HoverTool,
+    LinearColorMapper,
     PanTool,
     ResetTool,
     SaveTool,
@@ -29,78 +53,300 @@ from bokeh.models import (
 )
 from bokeh.palettes import magma
 from bokeh.plotting import figure
+from bokeh.transform import linear_cmap
+
+from similarity import EMB_FILE, top_10_columns, top_10_data
+from similarity_index import TABLE_FILES
+
+COORDS_FILE: str = "../combined_graph/clusters/node_coordination.txt"
+CLUSTERS_FILE: str = "../combined_graph/clusters/node_clusters.txt"
+DICT_FILE: str = "../combined_graph/Combined_Dict.txt"
+
+SEARCH_FILE: str = "search.html"
+STAMP_FILE: str = ".search.html.sha256"
+
+# Sharded search index of the export mode
+EXPORT_DIR: str = "search"
+EXPORT_STAMP_FILE: str = "search/.sha256"
+SHARD_SIZE: int = 1024
+TOP_K: int = 10
+
+# Standalone plot of the webgl and density modes
+PLOT_FILE: str = "graph.html"
+RASTER_SIZE: int = 256
+POINTS_ZOOM: float = 0.1
+
+SEARCH_HEAD: str = (
+    "<!DOCTYPE html>\n"
+    '<html lang="en">\n'
+    "  <head>\n"
+    '    <meta charset="utf-8">\n'
+    '    <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script>\n'
+    '    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/css/bootstrap.min.css" integrity="sha384-Vkoo8x4CGsO3+Hhxv8T/Q5PaXtkKtu6ug5TOeNV6gBiFeWPGFN9MuhOf23Q9Ifjh" crossorigin="anonymous">\n'
+    '    <script src="https://cdnjs.cloudflare.com/ajax/libs/select2/4.0.6-rc.0/js/select2.min.js"></script>\n'
+    '    <link href="https://cdn.jsdelivr.net/npm/select2@4.0.13/dist/css/select2.min.css" rel="stylesheet" />\n'
+    "  <head>\n"
+    "  <body>\n"
+    '    <div class="container">\n'
+    '      <div class="row mt-2 mx-auto">\n'
+    '        <div class="col">\n'
+    '          <select id="search" class="btn form-control">\n'
+)
 
-from similarity import top_10, top_10_data
+SEARCH_OPTION: str = (
+    '            <option value="{name} ({category})" name="{name}" '
+    'types="{types}" top="{top}" similarity="{similarity}">'
+    "{name} ({category})</option>\n"
+)
 
+SEARCH_TAIL: str = (
+    "          </select>\n"
+    "        </div>\n"
+    "      </div>\n"
+    '      <div class="row mt-2 mx-auto">\n'
+    '        <div class="col">\n'
+    '          <table id="similarityTable" class="table table-striped">\n'
+    '            <thead class="thead-light">\n'
+    "              <tr>\n"
+    '                <th scope="col">Name</th>\n'
+    '                <th scope="col">Type</th>\n'
+    '                <th scope="col">Association</th>\n'
+    '                <th scope="col">Cosine Similarity</th>\n'
+    "              <tr>\n"
+    "            <thead>\n"
+    "            <tbody></tbody>\n"
+    "          <table>\n"
+    "        </div>\n"
+    "      </div>\n"
+    "    <div>\n"
+    '  <script>$("#search").select2({ placeholder: "Select an entity" });</script>\n'
+    '  <script>$("#search").on("select2:select", function(e) { '
+    "let attrs = e.params.data.element.attributes; "
+    "let name = attrs.name.nodeValue; "
+    'let tops = attrs.top.nodeValue.split(","); '
+    'let types = attrs.types.nodeValue.split(","); '
+    'let sims = attrs.similarity.nodeValue.split(","); '
+    "console.log(attrs); "
+    '$("#similarityTable tbody").empty(); '
+    "tops.forEach((top, idx) => { "
+    "let sim = sims[idx]; "
+    "let type = types[idx]; "
+    '$("#similarityTable").append(`<tr><td>${top.trim()}</td><td>${type.trim()}</td><td>${name}</td><td>${sim.trim()}</td></tr>`);}) '
+    "})"
+    "</script>\n"
+    "  <body>\n"
+    "</html>\n"
+)
+
+
+EXPORT_PAGE: str = """<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8">
+    <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script>
+    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/css/bootstrap.min.css" integrity="sha384-Vkoo8x4CGsO3+Hhxv8T/Q5PaXtkKtu6ug5TOeNV6gBiFeWPGFN9MuhOf23Q9Ifjh" crossorigin="anonymous">
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/select2/4.0.6-rc.0/js/select2.min.js"></script>
+    <link href="https://cdn.jsdelivr.net/npm/select2@4.0.13/dist/css/select2.min.css" rel="stylesheet" />
+  </head>
+  <body>
+    <div class="container">
+      <div class="row mt-2 mx-auto">
+        <div class="col">
+          <select id="search" class="btn form-control"></select>
+        </div>
+      </div>
+      <div class="row mt-2 mx-auto">
+        <div class="col">
+          <table id="similarityTable" class="table table-striped">
+            <thead class="thead-light">
+              <tr>
+                <th scope="col">Name</th>
+                <th scope="col">Type</th>
+                <th scope="col">Association</th>
+                <th scope="col">Cosine Similarity</th>
+              </tr>
+            </thead>
+            <tbody></tbody>
+          </table>
+        </div>
+      </div>
+    </div>
+    <script>
+      // Neighbor shards, fetched once when first needed
+      const shards = {};
+
+      // float16 bits to number
+      function half(bits) {
+        const sign = bits & 0x8000 ? -1 : 1;
+        const exponent = (bits >> 10) & 0x1f;
+        const fraction = bits & 0x3ff;
+        if (exponent === 0) return sign * fraction * 2 ** -24;
+        if (exponent === 31) return fraction ? NaN : sign * Infinity;
+        return sign * (1 + fraction / 1024) * 2 ** (exponent - 15);
+      }
+
+      // [id, similarity] of the top k neighbors of id
+      async function neighbors(index, id) {
+        const shard = Math.floor(id / index.shard_size);
+        if (!(shard in shards)) {
+          shards[shard] = fetch(`neighbors/${shard}.bin`).then(
+            (response) => response.arrayBuffer()
+          );
+        }
+        const buffer = await shards[shard];
+        const k = index.k;
+        const count = buffer.byteLength / (6 * k);
+        const row = id % index.shard_size;
+        const tops = new Int32Array(buffer, 4 * k * row, k);
+        const sims = new Uint16Array(buffer, 4 * k * count + 2 * k * row, k);
+        return Array.from(tops, (top, idx) => [top, half(sims[idx])]);
+      }
+
+      fetch("names.json").then((response) => response.json()).then((index) => {
+        const texts = index.entities.map(
+          ([name, category]) => `${name} (${category})`
+        );
+        const lowered = texts.map((text) => text.toLowerCase());
+
+        // At most 100 entities matching the term, so the dropdown stays
+        // small whatever the number of entities
+        function search(term) {
+          term = term.toLowerCase();
+          const results = [];
+          for (let idx = 0; idx < texts.length && results.length < 100; idx++) {
+            if (lowered[idx].includes(term)) {
+              results.push({ id: idx, text: texts[idx] });
+            }
+          }
+          return { results: results };
+        }
+
+        $("#search").select2({
+          placeholder: "Select an entity",
+          minimumInputLength: 1,
+          ajax: {
+            delay: 100,
+            transport: (params, success) => success(search(params.data.term || "")),
+          },
+        });
+
+        $("#search").on("select2:select", async (e) => {
+          const [name, , id] = index.entities[e.params.data.id];
+          const rows = id < 0 ? [] : await neighbors(index, id);
+          const tbody = $("#similarityTable tbody").empty();
+          rows.forEach(([top, sim]) => {
+            tbody.append(
+              $("<tr>").append(
+                $("<td>").text(index.names[top]),
+                $("<td>").text(index.types[top]),
+                $("<td>").text(name),
+                $("<td>").text(sim.toFixed(4))
+              )
+            );
+          });
+        });
+      });
+    </script>
+  </body>
+</html>
+"""
 
-def main() -> None:
-    """The main function."""
 
-    # Get the data
-    reader_cors = csv.reader(
-        open("../combined_graph/clusters/node_coordination.txt"), delimiter=";"
+def read_table(path: str, columns: List[str]) -> pd.DataFrame:
+    """Read a semicolon-separated file without a header (quoted like
+    csv.reader does)."""
+
+    return pd.read_csv(
+        path,
+        sep=";",
+        header=None,
+        names=columns,
+        dtype={"label": str},
+        keep_default_na=False,
     )
 
-    reader_clusters = csv.reader(
-        open("../combined_graph/clusters/node_clusters.txt"), delimiter=";"
+
+def clean(names: pd.Series) -> pd.Series:
+    """Replace tabs and double spaces in names."""
+
+    return names.str.replace("\t", " ", regex=False).str.replace(
+        "  ", " ", regex=False
     )
 
-    node_data = top_10_data()
 
-    # Process the data
-    names: List[str] = []
-    clusters: List[float] = []
-    categories: List[str] = []
-
-    x_cors: List[float] = []
-    y_cors: List[float] = []
-
-    top_10s: List[str] = []
-    similarities: List[List[float]] = []
-
-    for row_cors, row_clusters in zip(reader_cors, reader_clusters):
-        if "@" in row_cors[0]:
-            items = row_cors[0].split("@")
-            names.append(items[0])
-            categories.append(items[1])
-        else:
-            names.append(row_cors[0])
-            categories.append("NA")
-        clusters.append(int(row_clusters[1]))
-        x_cors.append(float(row_cors[1]))
-        y_cors.append(float(row_cors[2]))
-        top = top_10(row_cors[0], node_data)
-
-        if len(top) == 2:
-            top_10s.append(", ".join(top[0]))
-            similarities.append(top[1])
-
-        elif len(top) == 1:
-            if top[0]:
-                top_10s.append(", ".join(top[0]))
-            elif top[1]:
-                similarities.append(top[1])
-
-        elif len(top) == 0:
-            top_10s.append("")
-            similarities.append([])
-
-    # Cleanup
-    names = [name.replace("\t", " ").replace("  ", " ") for name in names]
-
-    # Create a dataframe
-    df = pd.DataFrame(
-        {
-            "name": names,
-            "cluster": clusters,
-            "category": categories,
-            "x": x_cors,
-            "y": y_cors,
-            "top10": top_10s,
-            "similarity": similarities,
-        }
+def inputs_digest() -> str:
+    """SHA-256 of every input of the page (and of this program and the
+    similarity modules its search data comes from)."""
+
+    paths = [COORDS_FILE, CLUSTERS_FILE, DICT_FILE, __file__]
+    for name in ("similarity", "similarity_index"):
+        paths.append(sys.modules[name].__file__)
+    paths.extend(EMB_FILE + suffix for suffix in (".norm.npy", ".words.txt"))
+    paths.extend(EMB_FILE + suffix for suffix in TABLE_FILES)
+
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(2 ** 20), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def load_labels() -> pd.DataFrame:
+    """Label, coordinates and cluster of every plotted node."""
+
+    coords = read_table(COORDS_FILE, ["label", "x", "y"])
+    clusters = read_table(CLUSTERS_FILE, ["label", "cluster"])
+
+    return coords.merge(
+        clusters.drop_duplicates("label", keep="last"), on="label"
     )
 
+
+def load_nodes(node_data: Tuple[Any, Any, Any]) -> pd.DataFrame:
+    """The plotted nodes: name, cluster, category, coordinates and the top
+    10 of every node, joined on the node name."""
+
+    df = load_labels()
+
+    parts = df["label"].str.split("@")
+    df["name"] = clean(parts.str[0])
+    df["category"] = parts.str[1].fillna("NA")
+
+    df["top10"], df["similarity"] = top_10_columns(df["label"], node_data)
+
+    return df[["name", "cluster", "category", "x", "y", "top10", "similarity"]]
+
+
+def new_figure(tools: List[Any], output_backend: str = "canvas") -> figure:
+    """The styled, empty figure of the visualization."""
+
+    # Define the plot and add the attributes
+    plot = figure(
+        tools=tools,
+        title="COVID-19 Co-occurence Network Embeddings Visualization "
+        "(by David Oniani and Dr. Feichen Shen)",
+        background_fill_color="#fafafa",
+        plot_height=300,
+        sizing_mode="scale_width",
+        output_backend=output_backend,
+    )
+
+    plot.toolbar.active_scroll = plot.select_one(WheelZoomTool)
+
+    # Remove redundant elements
+    plot.axis.visible = False
+    plot.title.align = "center"
+    plot.title.text_font_size = "16pt"
+    plot.title.text_font_style = "italic"
+
+    return plot
+
+
+def build_plot(df: pd.DataFrame) -> figure:
+    """The Bokeh scatter plot of the nodes, colored by cluster."""
+
     # Selecting the colors for each unique category in album_name
     unique_clusters = df["cluster"].unique()
     palette = magma(len(unique_clusters) + 1)
@@ -109,7 +355,7 @@ def main() -> None:
     colormap = dict(zip(unique_clusters, palette))
 
     # Making a color column based on album_name
-    df["color"] = df["cluster"].map(colormap)
+    df = df.assign(color=df["cluster"].map(colormap))
 
     # Interactive elements
     interactive_tools = [
@@ -127,23 +373,7 @@ def main() -> None:
         SaveTool(),
     ]
 
-    # Define the plot and add the attributes
-    plot = figure(
-        tools=interactive_tools,
-        title="COVID-19 Co-occurence Network Embeddings Visualization "
-        "(by David Oniani and Dr. Feichen Shen)",
-        background_fill_color="#fafafa",
-        plot_height=300,
-        sizing_mode="scale_width",
-    )
-
-    plot.toolbar.active_scroll = plot.select_one(WheelZoomTool)
-
-    # Remove redundant elements
-    plot.axis.visible = False
-    plot.title.align = "center"
-    plot.title.text_font_size = "16pt"
-    plot.title.text_font_style = "italic"
+    plot = new_figure(interactive_tools)
 
     # Show (and save) the plot
     plot.circle(
@@ -161,118 +391,228 @@ def main() -> None:
     #     )
     #     show(plot)
 
-    # CODE GENERATION -- MIGHT LOOK UGLY
-    with open("search.html", "w") as file:
+    return plot
+
+
+def build_fast_plot(df: pd.DataFrame, density: bool = False) -> figure:
+    """The scatter plot of the nodes drawn with WebGL.
+
+    Its source only holds the float32 coordinates and the int32 cluster and
+    id (the row in df) of every node, the names are shipped once for the
+    hover. With density=True the nodes are first shown as a log-scaled
+    density raster aggregated here, and as points only once the visible x
+    range is at most POINTS_ZOOM of the whole plot."""
+
+    source = ColumnDataSource(
+        {
+            "x": df["x"].to_numpy(dtype=np.float32),
+            "y": df["y"].to_numpy(dtype=np.float32),
+            "cluster": df["cluster"].to_numpy(dtype=np.int32),
+            "id": np.arange(len(df), dtype=np.int32),
+        }
+    )
+
+    # Interactive elements
+    interactive_tools = [
+        HoverTool(
+            tooltips=[("name", "@id{name}")],
+            formatters={
+                "@id": CustomJSHover(
+                    args={"names": ColumnDataSource({"name": df["name"]})},
+                    code='return names.data["name"][value]',
+                )
+            },
+        ),
+        WheelZoomTool(),
+        PanTool(),
+        BoxZoomTool(),
+        ResetTool(),
+        SaveTool(),
+    ]
 
-        file.write("<!DOCTYPE html>\n")
-        file.write('<html lang="en">\n')
-        file.write("  <head>\n")
-        file.write('    <meta charset="utf-8">\n')
+    plot = new_figure(interactive_tools, output_backend="webgl")
 
-        file.write(
-            '    <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script>\n'
+    if density:
+        # Log-scaled node counts of a RASTER_SIZE x RASTER_SIZE grid, empty
+        # cells are left blank
+        counts, x_edges, y_edges = np.histogram2d(
+            df["x"], df["y"], bins=RASTER_SIZE
         )
-        file.write(
-            '    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/css/bootstrap.min.css" integrity="sha384-Vkoo8x4CGsO3+Hhxv8T/Q5PaXtkKtu6ug5TOeNV6gBiFeWPGFN9MuhOf23Q9Ifjh" crossorigin="anonymous">\n'
+        image = np.log1p(counts.T).astype(np.float32)
+        image[image == 0] = np.nan
+
+        raster = plot.image(
+            image=[image],
+            x=x_edges[0],
+            y=y_edges[0],
+            dw=x_edges[-1] - x_edges[0],
+            dh=y_edges[-1] - y_edges[0],
+            color_mapper=LinearColorMapper(
+                palette=magma(256)[::-1], nan_color="#fafafa"
+            ),
         )
 
-        file.write(
-            '    <script src="https://cdnjs.cloudflare.com/ajax/libs/select2/4.0.6-rc.0/js/select2.min.js"></script>\n'
-        )
+    points = plot.circle(
+        x="x",
+        y="y",
+        source=source,
+        color=linear_cmap(
+            "cluster",
+            magma(df["cluster"].nunique() + 1),
+            df["cluster"].min(),
+            df["cluster"].max(),
+        ),
+        alpha=0.8,
+        size=4.5,
+    )
 
-        file.write(
-            '    <link href="https://cdn.jsdelivr.net/npm/select2@4.0.13/dist/css/select2.min.css" rel="stylesheet" />\n'
+    if density:
+        # Swap the raster for the points when zoomed in
+        points.visible = False
+        toggle = CustomJS(
+            args={
+                "points": points,
+                "raster": raster,
+                "x_range": plot.x_range,
+                "limit": POINTS_ZOOM * (x_edges[-1] - x_edges[0]),
+            },
+            code="points.visible = x_range.end - x_range.start <= limit; "
+            "raster.visible = !points.visible;",
         )
+        plot.x_range.js_on_change("start", toggle)
+        plot.x_range.js_on_change("end", toggle)
+
+    return plot
 
-        file.write("  <head>\n")
-        file.write("  <body>\n")
 
-        file.write('    <div class="container">\n')
-        file.write('      <div class="row mt-2 mx-auto">\n')
-        file.write('        <div class="col">\n')
+def render_search(df: pd.DataFrame) -> str:
+    """The search page of the nodes."""
 
-        # Selection
-        file.write('          <select id="search" class="btn form-control">\n')
+    # Category of every (cleaned) name
+    assoc = read_table(DICT_FILE, ["label", "id"])
+    parts = assoc["label"].str.split("@")
+    names_cats = dict(zip(clean(parts.str[0]), parts.str[1].fillna("NA")))
 
-        reader_assoc = csv.reader(
-            open("../combined_graph/Combined_Dict.txt"), delimiter=";"
+    options = []
+    for name, category, top, similarity in zip(
+        df["name"], df["category"], df["top10"], df["similarity"]
+    ):
+        types = ", ".join(
+            names_cats.get(item.strip(), "NA") for item in top.split(",")
+        )
+        options.append(
+            SEARCH_OPTION.format(
+                name=name,
+                category=category,
+                types=types,
+                top=top,
+                similarity=", ".join(map(str, similarity)),
+            )
         )
 
-        names_cats: Dict[str, str] = {}
-        for row in reader_assoc:
-            if "@" in row[0]:
-                items = row[0].split("@")
-                names_cats[
-                    items[0].replace("\t", " ").replace("  ", " ")
-                ] = items[1]
-            else:
-                names_cats[row[0].replace("\t", " ").replace("  ", " ")] = "NA"
-
-        for name, category, top, similarity in zip(
-            df["name"], df["category"], df["top10"], df["similarity"]
-        ):
-            similarity = ", ".join([str(i) for i in similarity])
-
-            temp = []
-            for item in top.split(","):
-                try:
-                    temp.append(names_cats[item.strip()])
-                except KeyError:
-                    temp.append("NA")
-            types = ", ".join(temp)
-
-            file.write(
-                f'            <option value="{name} ({category})" name="{name}" types="{types}" top="{top}" similarity="{similarity}">{name} ({category})</option>\n'
+    return SEARCH_HEAD + "".join(options) + SEARCH_TAIL
+
+
+def export_search(node_data: Tuple[Any, Any, Any]) -> None:
+    """Write the sharded search index and its page to EXPORT_DIR.
+
+    names.json holds the name and type of every embedding row (the ids)
+    and the [name, category, id] of every plotted node (id -1 without
+    embedding). The top TOP_K neighbors of ids n * SHARD_SIZE to
+    (n + 1) * SHARD_SIZE - 1 are stored in neighbors/<n>.bin as their
+    little-endian int32 ids followed by their float16 similarities."""
+
+    emb_index, node_dict, node_reverse_dict = node_data
+
+    parts = pd.Series(
+        [node_reverse_dict.get(word, "NA") for word in emb_index.words],
+        dtype=object,
+    ).str.split("@")
+    labels = load_labels()["label"]
+    entity_parts = labels.str.split("@")
+    ids = [emb_index.rows.get(node_dict.get(label), -1) for label in labels]
+
+    index = {
+        "k": TOP_K,
+        "shard_size": SHARD_SIZE,
+        "names": clean(parts.str[0]).tolist(),
+        "types": parts.str[1].fillna("NA").tolist(),
+        "entities": list(
+            zip(
+                clean(entity_parts.str[0]),
+                entity_parts.str[1].fillna("NA"),
+                ids,
             )
+        ),
+    }
+
+    os.makedirs(os.path.join(EXPORT_DIR, "neighbors"), exist_ok=True)
+    with open(os.path.join(EXPORT_DIR, "names.json"), "w") as file:
+        json.dump(index, file, separators=(",", ":"))
+    with open(os.path.join(EXPORT_DIR, "index.html"), "w") as file:
+        file.write(EXPORT_PAGE)
+
+    for lo in range(0, len(emb_index.words), SHARD_SIZE):
+        rows = np.arange(lo, min(lo + SHARD_SIZE, len(emb_index.words)))
+        indices, scores = emb_index.neighbors(rows, TOP_K)
+        path = os.path.join(
+            EXPORT_DIR, "neighbors", "{}.bin".format(lo // SHARD_SIZE)
+        )
+        with open(path, "wb") as file:
+            file.write(indices.astype("<i4").tobytes())
+            file.write(scores.astype("<f2").tobytes())
 
-        file.write("          </select>\n")
 
-        # Table
-        file.write("        </div>\n")
-        file.write("      </div>\n")
-        file.write('      <div class="row mt-2 mx-auto">\n')
-        file.write('        <div class="col">\n')
-        file.write(
-            '          <table id="similarityTable" class="table table-striped">\n'
-        )
-        file.write('            <thead class="thead-light">\n')
-        file.write("              <tr>\n")
-        file.write('                <th scope="col">Name</th>\n')
-        file.write('                <th scope="col">Type</th>\n')
-        file.write('                <th scope="col">Association</th>\n')
-        file.write('                <th scope="col">Cosine Similarity</th>\n')
-        file.write("              <tr>\n")
-        file.write("            <thead>\n")
-        file.write("            <tbody></tbody>\n")
-        file.write("          <table>\n")
-        file.write("        </div>\n")
-        file.write("      </div>\n")
-        file.write("    <div>\n")
-
-        # Scripts
-        file.write(
-            '  <script>$("#search").select2({ placeholder: "Select an entity" });</script>\n'
-        )
+def is_up_to_date(output: str, stamp_file: str, digest: str) -> bool:
+    """Whether output was built from the inputs of digest."""
+
+    if not (os.path.exists(output) and os.path.exists(stamp_file)):
+        return False
+    with open(stamp_file) as file:
+        return file.read() == digest
+
 
-        file.write(
-            '  <script>$("#search").on("select2:select", function(e) { '
-            "let attrs = e.params.data.element.attributes; "
-            "let name = attrs.name.nodeValue; "
-            'let tops = attrs.top.nodeValue.split(","); '
-            'let types = attrs.types.nodeValue.split(","); '
-            'let sims = attrs.similarity.nodeValue.split(","); '
-            "console.log(attrs); "
-            '$("#similarityTable tbody").empty(); '
-            "tops.forEach((top, idx) => { "
-            "let sim = sims[idx]; "
-            "let type = types[idx]; "
-            '$("#similarityTable").append(`<tr><td>${top.trim()}</td><td>${type.trim()}</td><td>${name}</td><td>${sim.trim()}</td></tr>`);}) '
-            "})"
-            "</script>\n",
+def main() -> None:
+    """The main function."""
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else "search"
+
+    if mode in ("webgl", "density"):
+        df = load_labels()
+        df["name"] = clean(df["label"].str.split("@").str[0])
+
+        output_file(
+            PLOT_FILE,
+            title="COVID-19 Co-occurence Network Embeddings Visualization",
         )
+        save(build_fast_plot(df, density=mode == "density"))
+        return
+
+    # Loads (or first builds) the similarity index and its top 10 table
+    node_data = top_10_data()
 
-        file.write("  <body>\n")
-        file.write("</html>\n")
+    # Skip everything if the output was built from the same inputs
+    digest = inputs_digest()
+    if mode == "export":
+        if is_up_to_date(EXPORT_DIR, EXPORT_STAMP_FILE, digest):
+            print(EXPORT_DIR, "is up to date")
+            return
+        export_search(node_data)
+        with open(EXPORT_STAMP_FILE, "w") as file:
+            file.write(digest)
+        return
+
+    if is_up_to_date(SEARCH_FILE, STAMP_FILE, digest):
+        print(SEARCH_FILE, "is up to date")
+        return
+
+    df = load_nodes(node_data)
+    build_plot(df)
+
+    with open(SEARCH_FILE, "w") as file:
+        file.write(render_search(df))
+    with open(STAMP_FILE, "w") as file:
+        file.write(digest)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 import csv
 
-from typing import Any, List, Tuple
+import numpy as np
 
-from gensim.models import KeyedVectors
+from typing import Any, Iterable, List, Tuple
+
+from similarity_index import load_index
+
+EMB_FILE = "../combined_graph/CombineGraph-nonDupe.emd"
 
 
 def top_10_data() -> Tuple[Any, Any, Any]:
@@ -17,38 +21,88 @@ def top_10_data() -> Tuple[Any, Any, Any]:
         node_dict[row[0]] = row[1]
         node_reverse_dict[row[1]] = row[0]
 
-    emb_mappings = KeyedVectors.load_word2vec_format(
-        "../combined_graph/CombineGraph-nonDupe.emd", binary=False
-    )
+    # Normalized once and stored next to the embedding file, together with
+    # the precomputed top 10 of every node
+    emb_index = load_index(EMB_FILE, top_k=10)
 
-    return emb_mappings, node_dict, node_reverse_dict
+    return emb_index, node_dict, node_reverse_dict
 
 
 def top_10(node: str, node_data: Tuple[Any, Any, Any]) -> List:
     """Give top 10 most similar nodes for the given node."""
 
-    emb_mappings, node_dict, node_reverse_dict = node_data
+    return top_10_batch([node], node_data)[0]
+
+
+def top_10_batch(
+    nodes: Iterable[str], node_data: Tuple[Any, Any, Any]
+) -> List[List]:
+    """top_10 of every node, computed in one batch."""
+
+    emb_index, node_dict, node_reverse_dict = node_data
+
+    nodes = list(nodes)
+    indices = [node_dict[node] for node in nodes if node in node_dict]
+    results = iter(emb_index.most_similar_batch(indices))
+
+    tops: List[List] = []
+    for node in nodes:
+        if node not in node_dict:
+            tops.append([])
+            continue
+
+        top_10: List[str] = []
+        similarities: List[float] = []
+        for tup in next(results):
+            try:
+                name = node_reverse_dict[tup[0]]
+            except KeyError:
+                name = "NA"
 
-    try:
-        index = node_dict[node]
-    except KeyError:
-        return []
+            similarity: float = tup[1]
+            similarities.append(similarity)
 
-    s2 = emb_mappings.most_similar(index)
-    top_10: List[str] = []
-    similarities: List[float] = []
-    for tup in s2:
-        try:
-            name = node_reverse_dict[tup[0]]
-        except KeyError:
-            name = "NA"
+            if "@" in name:
+                top_10.append(name.split("@")[0])
+            else:
+                top_10.append(name)
 
-        similarity: float = tup[1]
-        similarities.append(similarity)
+        tops.append([top_10, similarities])
+
+    return tops
+
+
+def top_10_columns(
+    nodes: Iterable[str], node_data: Tuple[Any, Any, Any]
+) -> Tuple[List[str], List[List[float]]]:
+    """The top 10 of every node as the comma-separated names of the similar
+    nodes and their similarities, in one table lookup. Nodes without
+    embeddings get an empty top 10."""
+
+    emb_index, node_dict, node_reverse_dict = node_data
+
+    # Short name of the node of every index row
+    short_names = np.array(
+        [
+            node_reverse_dict.get(word, "NA").split("@")[0]
+            for word in emb_index.words
+        ],
+        dtype=object,
+    )
+
+    rows = np.array(
+        [emb_index.rows.get(node_dict.get(node), -1) for node in nodes],
+        dtype=np.int64,
+    )
+    found = np.flatnonzero(rows >= 0)
+    indices, scores = emb_index.neighbors(rows[found], 10)
 
-        if "@" in name:
-            top_10.append(name.split("@")[0])
-        else:
-            top_10.append(name)
+    tops = [""] * len(rows)
+    similarities: List[List[float]] = [[] for _ in range(len(rows))]
+    for idx, names, row_scores in zip(
+        found, short_names[indices], scores.tolist()
+    ):
+        tops[idx] = ", ".join(names)
+        similarities[idx] = row_scores
 
-    return [top_10, similarities]
+    return tops, similarities
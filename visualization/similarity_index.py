@@ -0,0 +1,335 @@
+"""
+Filename: similarity_index.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    Cosine similarity index over node embeddings.
+
+    The embeddings are normalized once, so a top-k query is a single matrix
+    product. Top-k queries for many nodes are answered in row blocks with
+    argpartition, and an optional HNSW graph index (hnswlib) answers them
+    approximately. The top-k neighbors of all nodes can also be precomputed
+    into a table, after which a query is an array lookup. The index is
+    stored next to the embedding file:
+
+        <embedding file>.norm.npy         normalized float32 vectors
+        <embedding file>.words.txt        the word of every row
+        <embedding file>.hnsw             HNSW graph index (optional)
+        <embedding file>.top_indices.npy  int32 top-k rows (optional)
+        <embedding file>.top_scores.npy   float32 top-k scores (optional)
+
+Usage (build the index and a top-k table offline):
+    python similarity_index.py file.emd [k] [--hnsw]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from embedding_store import load_store
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Memory cap of the similarity matrix of one block of batched queries
+MAX_BLOCK_BYTES: int = 256 * 2**20
+
+TABLE_FILES: Tuple[str, str] = (".top_indices.npy", ".top_scores.npy")
+
+
+class SimilarityIndex:
+    """Top-k cosine similarity queries over a fixed set of vectors."""
+
+    def __init__(self, words: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+
+        self.words = list(words)
+        self.vectors = vectors / norms
+        self.rows = {word: row for row, word in enumerate(self.words)}
+        self.hnsw = None
+        self.top_indices = None
+        self.top_scores = None
+
+    @classmethod
+    def from_keyed_vectors(cls, keyed_vectors) -> "SimilarityIndex":
+        """Build the index of gensim KeyedVectors."""
+
+        return cls(keyed_vectors.index2word, keyed_vectors.vectors)
+
+    @classmethod
+    def load(
+        cls, emb_file: str, mmap_mode: Optional[str] = "r"
+    ) -> "SimilarityIndex":
+        """Load the index stored next to emb_file by save."""
+
+        index = cls.__new__(cls)
+        with open(emb_file + ".words.txt") as file:
+            index.words = file.read().split("\n")[:-1]
+        index.vectors = np.load(emb_file + ".norm.npy", mmap_mode=mmap_mode)
+        index.rows = {word: row for row, word in enumerate(index.words)}
+        index.hnsw = None
+        index.top_indices = None
+        index.top_scores = None
+
+        if os.path.exists(emb_file + TABLE_FILES[0]):
+            index.top_indices, index.top_scores = (
+                np.load(emb_file + suffix, mmap_mode=mmap_mode)
+                for suffix in TABLE_FILES
+            )
+
+        if hnswlib is not None and os.path.exists(emb_file + ".hnsw"):
+            index.load_hnsw(emb_file + ".hnsw")
+
+        return index
+
+    def save(self, emb_file: str) -> None:
+        """Store the index next to emb_file."""
+
+        _save_array(emb_file + ".norm.npy", self.vectors)
+        with open(emb_file + ".words.txt", "w") as file:
+            for word in self.words:
+                file.write(word + "\n")
+
+        if self.hnsw is not None:
+            self.hnsw.save_index(emb_file + ".hnsw")
+
+        # A table of older embeddings must not be picked up by load
+        for suffix, table in zip(
+            TABLE_FILES, (self.top_indices, self.top_scores)
+        ):
+            if table is not None:
+                _save_array(emb_file + suffix, table)
+            elif os.path.exists(emb_file + suffix):
+                os.remove(emb_file + suffix)
+
+    def build_hnsw(self, ef_construction: int = 200, M: int = 16) -> None:
+        """Build the HNSW graph index, which requires hnswlib."""
+
+        if hnswlib is None:
+            raise ImportError("the HNSW index requires hnswlib")
+
+        self.hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+        self.hnsw.init_index(
+            max_elements=len(self.words), ef_construction=ef_construction, M=M
+        )
+        self.hnsw.add_items(self.vectors, np.arange(len(self.words)))
+
+    def load_hnsw(self, path: str) -> None:
+        """Load an HNSW graph index saved by save."""
+
+        self.hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+        self.hnsw.load_index(path, max_elements=len(self.words))
+
+    def top_k(
+        self,
+        rows: Optional[np.ndarray] = None,
+        k: int = 10,
+        approximate: bool = False,
+        max_bytes: int = MAX_BLOCK_BYTES,
+        candidates: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k most similar rows (other than the row itself) of every row
+        in rows (default all rows), best first. Returns the (len(rows), k)
+        row indices and cosine similarities.
+
+        Rows are processed in blocks whose float32 similarity matrix takes
+        at most max_bytes (argpartition needs twice that again for its
+        int64 indices). approximate=True uses the HNSW index instead.
+        candidates restricts the neighbors to those rows (exact only). If
+        only some rows are among the candidates, k can exceed the number of
+        neighbors of those: their last entry is then the row itself with
+        similarity -inf.
+        """
+
+        if rows is None:
+            rows = np.arange(len(self.words))
+        rows = np.asarray(rows, dtype=np.int64)
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            # The row itself is only excluded if it is a candidate
+            k = min(k, len(candidates) - int(np.isin(rows, candidates).all()))
+        else:
+            k = min(k, len(self.words) - 1)
+        if k <= 0 or len(rows) == 0:
+            return (
+                np.zeros((len(rows), max(k, 0)), dtype=np.int64),
+                np.zeros((len(rows), max(k, 0)), dtype=np.float32),
+            )
+
+        if approximate:
+            if candidates is not None:
+                raise ValueError("candidates require exact queries")
+            return self._top_k_hnsw(rows, k)
+
+        block_size = max(1, max_bytes // (4 * len(self.words)))
+
+        indices = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        for lo in range(0, len(rows), block_size):
+            block = rows[lo : lo + block_size]
+
+            # Negated similarities, so the smallest k are the top k
+            dists = self.vectors[block] @ self.vectors.T
+            np.negative(dists, out=dists)
+            dists[np.arange(len(block)), block] = np.inf
+            if candidates is not None:
+                dists = dists[:, candidates]
+
+            top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            top_dists = np.take_along_axis(dists, top, axis=1)
+            order = np.argsort(top_dists, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            if candidates is not None:
+                top = candidates[top]
+            indices[lo : lo + len(block)] = top
+            scores[lo : lo + len(block)] = -np.take_along_axis(
+                top_dists, order, axis=1
+            )
+
+        return indices, scores
+
+    def _top_k_hnsw(
+        self, rows: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top_k with the HNSW index."""
+
+        if self.hnsw is None:
+            raise ValueError("no HNSW index, call build_hnsw first")
+
+        self.hnsw.set_ef(max(2 * (k + 1), 50))
+        labels, distances = self.hnsw.knn_query(self.vectors[rows], k=k + 1)
+
+        # Drop each row itself (or the last neighbor if it was not found)
+        is_self = labels == rows[:, None]
+        is_self[~is_self.any(axis=1), -1] = True
+        keep = ~is_self
+
+        indices = labels[keep].reshape(len(rows), k).astype(np.int64)
+        scores = 1 - distances[keep].reshape(len(rows), k)
+
+        return indices, scores.astype(np.float32)
+
+    def precompute_top_k(
+        self, k: int = 10, max_bytes: int = MAX_BLOCK_BYTES
+    ) -> None:
+        """Compute the top-k table of all rows (int32 rows and float32
+        scores), which answers later queries of up to k neighbors."""
+
+        indices, scores = self.top_k(k=k, max_bytes=max_bytes)
+        self.top_indices = indices.astype(np.int32)
+        self.top_scores = scores
+
+    def neighbors(
+        self, rows: np.ndarray, k: int = 10
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top_k of rows, looked up in the precomputed table when it
+        holds at least k neighbors."""
+
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.top_indices is not None and 0 < k <= self.top_indices.shape[1]:
+            return self.top_indices[rows, :k], self.top_scores[rows, :k]
+
+        return self.top_k(rows, k)
+
+    def most_similar(
+        self, word: str, topn: int = 10
+    ) -> List[Tuple[str, float]]:
+        """Like KeyedVectors.most_similar: the topn most similar words of
+        word with their cosine similarities."""
+
+        return self.most_similar_batch([word], topn)[0]
+
+    def most_similar_batch(
+        self,
+        words: Iterable[str],
+        topn: int = 10,
+        approximate: bool = False,
+        candidates: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """most_similar of every word in words in one batch, among the
+        candidates rows if given. Unknown words get an empty list."""
+
+        words = list(words)
+        known = [word for word in words if word in self.rows]
+        rows = np.array([self.rows[word] for word in known], dtype=np.int64)
+
+        if not approximate and candidates is None:
+            indices, scores = self.neighbors(rows, topn)
+        else:
+            indices, scores = self.top_k(
+                rows, topn, approximate, candidates=candidates
+            )
+
+        results = {
+            word: [
+                (self.words[index], float(score))
+                for index, score in zip(row_indices, row_scores)
+                if index != row
+            ]
+            for word, row, row_indices, row_scores in zip(
+                known, rows, indices, scores
+            )
+        }
+
+        return [results.get(word, []) for word in words]
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    """np.save through a temporary file, so a memory map of the old file
+    (possibly the array itself) stays valid."""
+
+    with open(path + ".tmp", "wb") as file:
+        np.save(file, array)
+    os.replace(path + ".tmp", path)
+
+
+def load_index(
+    emb_file: str, hnsw: bool = False, top_k: int = 0
+) -> SimilarityIndex:
+    """Similarity index of the word2vec text file emb_file. The stored
+    index is used unless emb_file is newer, otherwise it is built (with
+    the HNSW graph if hnsw=True and a table of the top_k neighbors of all
+    nodes if top_k > 0) and stored next to emb_file."""
+
+    norm_file = emb_file + ".norm.npy"
+    if os.path.exists(norm_file) and os.path.getmtime(
+        norm_file
+    ) >= os.path.getmtime(emb_file):
+        index = SimilarityIndex.load(emb_file)
+        if hnsw and index.hnsw is None:
+            index.build_hnsw()
+            index.save(emb_file)
+        if top_k > 0 and (
+            index.top_indices is None or index.top_indices.shape[1] < top_k
+        ):
+            index.precompute_top_k(top_k)
+            index.save(emb_file)
+        return index
+
+    # Read through the binary store, the text file is parsed at most once
+    store = load_store(emb_file)
+    index = SimilarityIndex(store.words, store.vectors())
+    if hnsw:
+        index.build_hnsw()
+    if top_k > 0:
+        index.precompute_top_k(top_k)
+    index.save(emb_file)
+
+    return index
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--hnsw"]
+    load_index(
+        args[0],
+        hnsw="--hnsw" in sys.argv,
+        top_k=int(args[1]) if len(args) > 1 else 10,
+    )
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""
+Filename: similarity_service.py
+Author:   David Oniani
+E-mail:   oniani.david@mayo.edu
+
+Description:
+    HTTP service for "entities most similar to X" queries.
+
+    The embeddings and the entity dictionary are loaded once at startup into
+    a SimilarityIndex, requests are handled with asyncio and answers to hot
+    queries are kept in an LRU cache. Entities are named as in
+    Combined_Dict.txt, e.g. "pneumonia@Disease".
+
+    GET  /similar?name=pneumonia@Disease&k=10&type=Gene
+    POST /batch   {"names": ["pneumonia@Disease", ...], "k": 10,
+                   "type": "Gene"}
+    GET  /health
+
+    Every answer is JSON, a query answers a list of
+    {"name": ..., "type": ..., "similarity": ...} (best first) and an
+    unknown entity answers 404 (an empty list inside a batch). k must be
+    between 1 and MAX_K, otherwise the request answers 400.
+
+Usage:
+    python similarity_service.py [port]
+"""
+
+import asyncio
+import csv
+import json
+import sys
+
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from similarity import EMB_FILE
+from similarity_index import load_index
+
+DICT_FILE: str = "../combined_graph/Combined_Dict.txt"
+
+HOST: str = "127.0.0.1"
+PORT: int = 8765
+
+CACHE_SIZE: int = 4096
+MAX_K: int = 100
+
+Result = List[Dict[str, Any]]
+
+
+class LRUCache:
+    """Mapping that keeps the most recently used maxsize entries."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Any:
+        """The entry of key (marked as recently used) or None."""
+
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        """Store an entry, evicting the least recently used one."""
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class SimilarityService:
+    """Top-k, type-filtered and batch similarity queries over entities."""
+
+    def __init__(
+        self,
+        emb_file: str = EMB_FILE,
+        dict_file: str = DICT_FILE,
+        cache_size: int = CACHE_SIZE,
+    ) -> None:
+        self.index = load_index(emb_file, top_k=10)
+
+        # Entity name <-> embedding word
+        self.words: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        with open(dict_file) as file:
+            for row in csv.reader(file, delimiter=";"):
+                self.words[row[0]] = row[1]
+                self.names[row[1]] = row[0]
+
+        # Rows of the index of every type
+        types = np.array(
+            [
+                self._type(self.names.get(word, "NA"))
+                for word in self.index.words
+            ]
+        )
+        self.type_rows = {
+            entity_type: np.flatnonzero(types == entity_type)
+            for entity_type in np.unique(types)
+        }
+
+        self.cache = LRUCache(cache_size)
+
+        # Requests are answered off the event loop, one at a time (the
+        # cache is not thread-safe)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def _type(name: str) -> str:
+        """Type of an entity name, e.g. Disease for pneumonia@Disease."""
+
+        return name.split("@")[1] if "@" in name else "NA"
+
+    def query(
+        self, names: List[str], k: int = 10, entity_type: Optional[str] = None
+    ) -> List[Optional[Result]]:
+        """The k most similar entities (of entity_type only, if given) of
+        every name, None for unknown names. Cache misses are answered
+        together by one batched index query."""
+
+        keys = [(name, k, entity_type) for name in names]
+        results = [self.cache.get(key) for key in keys]
+
+        missing = [
+            name
+            for name, result in zip(names, results)
+            if result is None and name in self.words
+        ]
+        if missing:
+            candidates = None
+            if entity_type is not None:
+                candidates = self.type_rows.get(
+                    entity_type, np.zeros(0, dtype=np.int64)
+                )
+            answers = self.index.most_similar_batch(
+                [self.words[name] for name in missing],
+                k,
+                candidates=candidates,
+            )
+            computed = {}
+            for name, answer in zip(missing, answers):
+                result = []
+                for word, similarity in answer:
+                    other = self.names.get(word, "NA")
+                    result.append(
+                        {
+                            "name": other,
+                            "type": self._type(other),
+                            "similarity": similarity,
+                        }
+                    )
+                computed[name] = result
+                self.cache.put((name, k, entity_type), result)
+            results = [
+                computed.get(name) if result is None else result
+                for name, result in zip(names, results)
+            ]
+
+        return results
+
+    def handle(self, method: str, target: str, body: bytes) -> Tuple[int, Any]:
+        """Answer one request, returns the HTTP status and the JSON body."""
+
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/health":
+            return 200, {
+                "entities": len(self.index.words),
+                "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses,
+            }
+
+        try:
+            if method == "GET" and url.path == "/similar":
+                params = {
+                    key: values[-1]
+                    for key, values in parse_qs(url.query).items()
+                }
+                names = [params["name"]]
+            elif method == "POST" and url.path == "/batch":
+                params = json.loads(body or b"{}")
+                names = params["names"]
+                if not isinstance(names, list) or not all(
+                    isinstance(name, str) for name in names
+                ):
+                    raise TypeError("names must be a list of strings")
+            else:
+                return 404, {"error": "not found"}
+            k = int(params.get("k", 10))
+            if not 1 <= k <= MAX_K:
+                raise ValueError("k must be between 1 and {}".format(MAX_K))
+            entity_type = params.get("type")
+            if entity_type is not None and not isinstance(entity_type, str):
+                raise TypeError("type must be a string")
+        except (KeyError, ValueError, TypeError) as error:
+            return 400, {"error": "bad request: {}".format(error)}
+
+        results = self.query(names, k, entity_type)
+        if url.path == "/batch":
+            return 200, [result or [] for result in results]
+        if results[0] is None:
+            return 404, {"error": "unknown entity {!r}".format(names[0])}
+
+        return 200, results[0]
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of one (keep-alive) connection."""
+
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await loop.run_in_executor(
+                    self.executor, self.handle, method, target, body
+                )
+                content = json.dumps(payload).encode()
+                close = headers.get("connection", "").lower() == "close"
+
+                writer.write(
+                    "HTTP/1.1 {} {}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Content-Length: {}\r\n"
+                    "Connection: {}\r\n\r\n".format(
+                        status,
+                        {200: "OK", 400: "Bad Request"}.get(
+                            status, "Not Found"
+                        ),
+                        len(content),
+                        "close" if close else "keep-alive",
+                    ).encode()
+                    + content
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service: SimilarityService, host: str, port: int) -> None:
+    """Run the service until cancelled."""
+
+    server = await asyncio.start_server(service.serve_client, host, port)
+    print("Serving on http://{}:{}".format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    """The main function."""
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    service = SimilarityService()
+    asyncio.run(serve(service, HOST, port))
+
+
+if __name__ == "__main__":
+    main()